@@ -0,0 +1,63 @@
+import hashlib
+from collections import OrderedDict
+import numpy as np
+
+class FactorCache:
+  """
+  FactorCache: Cache of matrix factorizations for repeated solves of the same geometry.
+
+  The key is a hash of the mesh planes that determine the conductance matrix:
+  _resis, the hole mask, _isoflag and _boundCond, plus the solver backend name and
+  the damping conductance. The heat sources only change the RHS, so a new heat map
+  with the same key reuses the factorization and only needs a forward/back substitution.
+
+  The cache holds at most maxEntries factorizations, the least recently used one is evicted.
+  """
+
+  def __init__(self, maxEntries):
+    self.maxEntries= maxEntries
+    self.entries= OrderedDict()
+    self.hits= 0
+    self.misses= 0
+    self.evictions= 0
+
+  def meshKey(self, mesh, backend, damping, extraPlanes=[]):
+    """
+    meshKey(FactorCache self, Mesh mesh, string backend, float damping, list extraPlanes)
+    Hash of the conductance-determining inputs of the mesh.
+    Matrices that depend on more than the conductance, such as the heat capacity
+    in transient analysis, pass those planes in extraPlanes.
+    """
+    digest= hashlib.sha1()
+    planes= [mesh.field[:, :, mesh._resis],
+             mesh.ifield[:, :, mesh._holeflag] < 0,
+             mesh.ifield[:, :, mesh._isoflag],
+             mesh.field[:, :, mesh._boundCond],
+             np.array([mesh.width, mesh.height], dtype = 'int64'),
+             np.array([damping], dtype = 'double')]
+    for plane in planes + extraPlanes:
+      digest.update(np.ascontiguousarray(plane).data)
+    return (backend, digest.hexdigest())
+
+  def get(self, key):
+    if key in self.entries:
+      factor= self.entries.pop(key)
+      self.entries[key]= factor
+      self.hits += 1
+      return factor
+    self.misses += 1
+    return None
+
+  def put(self, key, factor):
+    if self.maxEntries <= 0:
+      return
+    if key in self.entries:
+      self.entries.pop(key)
+    self.entries[key]= factor
+    while len(self.entries) > self.maxEntries:
+      self.entries.popitem(last=False)
+      self.evictions += 1
+
+  def report(self, backend):
+    print "Factorization cache " + backend + ": hits= " + str(self.hits) + " misses= " + str(self.misses) + \
+      " evictions= " + str(self.evictions) + " entries= " + str(len(self.entries)) + "/" + str(self.maxEntries)
@@ -47,9 +47,9 @@ class Matls(PCModel):
   def distributeIsotropicProperties(self):
     for matl in self.matls:
       if 'conductivity' in matl and str(matl['conductivity']) != '-':
-        matl['conductivityXX'] = matl['conductivity']
-        matl['conductivityYY'] = matl['conductivity']
-        matl['conductivityZZ'] = matl['conductivity']
+        for prop in ['conductivityXX', 'conductivityYY', 'conductivityZZ']:
+          matl[prop] = matl['conductivity']
+          self.propDict[matl['name']][prop] = matl['conductivity']
         
 # HTML Generation
   
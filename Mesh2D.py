@@ -1,6 +1,14 @@
 from PIL import Image, ImageDraw
+import os
+import glob
+import json
+import hashlib
 import yaml
 import numpy as np
+import scipy.ndimage as ndimage
+import Palette
+import PlaneStack
+import MeshCache
 class Mesh:
 
   """
@@ -134,8 +142,18 @@ class Mesh:
     self.nodeX= []
     self.nodeY= []
     
-    self.defineProblem(config['mesh'], lyr, matls)
-    self.mapMeshToSolutionMatrix(lyr)
+    self.edgeCache= None
+    self.runKey= ''
+    if self.runDirectory != '' or self.meshCache is not None:
+      self.runKey= self.runDigest(config, lyr, matls)
+    if self.openRun() == False:
+      if self.meshCache is None or self.meshCache.load(self.runKey, self) == False:
+        self.defineProblem(config['mesh'], lyr, matls)
+        self.findThermalIslands(config.get('islandAction', 'drop'))
+        self.mapMeshToSolutionMatrix(lyr)
+        if self.meshCache is not None:
+          self.meshCache.store(self.runKey, self)
+      self.saveRun()
     
     # TODO: Doesn't make sense that the mesh doesn't have a copy of all of lyr.
     # Refactor it out of other calls.
@@ -145,14 +163,123 @@ class Mesh:
     """
     __init__(Mesh self, int w, int h, Matls matls)
     Create a square mesh of size w by h.
-    The mesh data structure is in self.field, which holds double precision numbers,
-    and self.ifield, which holds integers.
+    The mesh data structure is in self.field, which holds floating point numbers,
+    and self.ifield, which holds integers. Both are PlaneStacks indexed [x, y, layer],
+    with the storage type of each layer from the simulation_layers configuration.
+    With a runDirectory the layers are memory-mapped files in that directory.
+    The plot coordinates xr and yr are read-only broadcast views that take no memory.
     """    
     self.width = w
     self.height = h
-    self.field = np.zeros((self.width, self.height, self.numdoublelayers), dtype = 'double')
-    self.ifield = np.zeros((self.width, self.height, self.numintlayers), dtype = 'int')
-    self.xr, self.yr= np.mgrid[0:self.width+1, 0:self.height+1]
+    self.field = PlaneStack.PlaneStack(self.width, self.height, self.doubleStorage,
+                                       self.runDirectory, self.doubleNames, 'field', self.reopenRun)
+    self.ifield = PlaneStack.PlaneStack(self.width, self.height, self.intStorage,
+                                        self.runDirectory, self.intNames, 'ifield', self.reopenRun)
+    self.xr= np.broadcast_to(np.arange(self.width+1, dtype = 'int32')[:, np.newaxis], (self.width+1, self.height+1))
+    self.yr= np.broadcast_to(np.arange(self.height+1, dtype = 'int32')[np.newaxis, :], (self.width+1, self.height+1))
+    
+  def runDigest(self, config, lyr, matls):
+    """
+    runDigest(Mesh self, config, Layers lyr, Matls matls)
+    Hash of everything the mesh is built from: the active problem definitions and their
+    input PNG files, the palette, the simulation layers, the materials and the stackup.
+    """
+    digest= hashlib.sha1()
+    inputs= {'mesh': [problem for problem in config['mesh'] if problem['active'] == 1],
+             'palette': config.get('palette', {}),
+             'simulation_layers': config['simulation_layers'],
+             'pixelPitch': self.pixelPitch,
+             'islandAction': config.get('islandAction', 'drop'),
+             'matls': matls.matlConfig,
+             'layers': lyr.layerConfig}
+    digest.update(json.dumps(inputs, sort_keys=True).encode('utf-8'))
+    for problem in inputs['mesh']:
+      if problem['type'] == "png":
+        with open(problem['inputFile'], 'rb') as pngHandle:
+          digest.update(pngHandle.read())
+    return digest.hexdigest()
+    
+  def openRun(self):
+    """
+    openRun(Mesh self)
+    Reopen the mesh in runDirectory if it was built from the same inputs.
+    The layers and the node locations are memory-mapped, so nothing is read until it is used
+    and the PNG does not need to be decoded again.
+    Otherwise the directory is cleared for a new mesh. Returns True if the run was reopened.
+    """
+    if self.runDirectory == '':
+      return False
+    metaFn= os.path.join(self.runDirectory, 'mesh_run.json')
+    if os.path.exists(metaFn):
+      with open(metaFn, 'r') as metaHandle:
+        meta= json.load(metaHandle)
+      if meta['key'] == self.runKey:
+        self.reopenRun= True
+        self.setMeshSize(meta['width'], meta['height'])
+        self.nodeCount= meta['nodeCount']
+        self.nodeXn= np.load(os.path.join(self.runDirectory, 'nodeXn.npy'), mmap_mode='r')
+        self.nodeYn= np.load(os.path.join(self.runDirectory, 'nodeYn.npy'), mmap_mode='r')
+        self.restoreSummary(meta)
+        print "Reopened mesh run in " + self.runDirectory + " Width: " + str(self.width) + " Height: " + str(self.height)
+        print "Total number of independent nodes= ", self.nodeCount
+        return True
+      print "Mesh inputs changed, rebuilding mesh run in " + self.runDirectory
+      os.remove(metaFn)
+    if not os.path.exists(self.runDirectory):
+      os.makedirs(self.runDirectory)
+    for pattern in ['field_*.npy', 'ifield_*.npy', 'nodeXn.npy', 'nodeYn.npy']:
+      for fn in glob.glob(os.path.join(self.runDirectory, pattern)):
+        os.remove(fn)
+    return False
+    
+  def saveRun(self):
+    """
+    saveRun(Mesh self)
+    Write the node locations and the description of a new mesh run.
+    The description is written last, so an interrupted run is never reopened.
+    """
+    if self.runDirectory == '':
+      return
+    np.save(os.path.join(self.runDirectory, 'nodeXn.npy'), self.nodeXn)
+    np.save(os.path.join(self.runDirectory, 'nodeYn.npy'), self.nodeYn)
+    self.flush()
+    meta= {'key': self.runKey, 'width': self.width, 'height': self.height, 'nodeCount': self.nodeCount}
+    meta.update(self.runSummary())
+    with open(os.path.join(self.runDirectory, 'mesh_run.json'), 'w') as metaHandle:
+      json.dump(meta, metaHandle)
+    
+  def runSummary(self):
+    """
+    runSummary(Mesh self)
+    The thermal islands, palette pixel counts and unrecognized colors of the mesh as JSON values,
+    for the mesh_run.json of a run directory.
+    """
+    summary= {}
+    if hasattr(self, 'islands'):
+      summary['islands']= [{'label': int(island['label']), 'cells': int(island['cells']), 'heat': float(island['heat']),
+                            'bbox': [int(v) for v in island['bbox']], 'boundary': bool(island['boundary'])}
+                           for island in self.islands]
+    if hasattr(self, 'pixelCounts'):
+      summary['pixelCounts']= self.pixelCounts
+    if hasattr(self, 'unknownColors'):
+      summary['unknownColors']= [[list(rgb), count] for rgb, count in self.unknownColors]
+    return summary
+    
+  def restoreSummary(self, meta):
+    """
+    restoreSummary(Mesh self, dict meta)
+    Restore the islands, pixelCounts and unknownColors of a reopened run from runSummary.
+    """
+    if 'islands' in meta:
+      self.islands= [dict(island, bbox=tuple(island['bbox'])) for island in meta['islands']]
+    if 'pixelCounts' in meta:
+      self.pixelCounts= dict([(str(name), count) for name, count in meta['pixelCounts'].items()])
+    if 'unknownColors' in meta:
+      self.unknownColors= [(tuple(rgb), count) for rgb, count in meta['unknownColors']]
+    
+  def flush(self):
+    self.field.flush()
+    self.ifield.flush()
     
   def solveTemperatureNodeCount(self):
     """ 
@@ -174,6 +301,50 @@ class Mesh:
       return -1
     return self.ifield[x, y, self._holeflag]
 
+  def findThermalIslands(self, action):
+    """
+    findThermalIslands(Mesh self, string action)
+    Label the connected groups of non-hole cells, and find the thermal islands,
+    which are groups without any _isoflag boundary condition cell.
+    An island has no path for its heat to reach a boundary, so it makes the matrix singular.
+    action "drop" turns the islands into holes, "flag" only reports them.
+    The label of each cell is loaded into the _island layer, zero for holes.
+    self.islands is a list with one dictionary per group, with the label, cell count, total heat,
+    bounding box (xmin, ymin, xmax, ymax) and whether it has a boundary condition.
+    """
+    occupied= self.ifield[:, :, self._holeflag] >= 0
+    labels, groupCount= ndimage.label(occupied)
+    self.ifield[:, :, self._island]= labels
+    
+    cells= np.bincount(labels.ravel(), minlength=groupCount + 1)
+    heat= np.bincount(labels.ravel(), weights=self.field[:, :, self._heat].ravel(), minlength=groupCount + 1)
+    boundary= np.bincount(labels.ravel(), weights=(self.ifield[:, :, self._isoflag] == 1).ravel(), minlength=groupCount + 1)
+    self.islands= []
+    for label, box in enumerate(ndimage.find_objects(labels), 1):
+      self.islands.append({'label': label, 'cells': int(cells[label]), 'heat': heat[label],
+                           'bbox': (box[0].start, box[1].start, box[0].stop - 1, box[1].stop - 1),
+                           'boundary': boundary[label] > 0})
+    
+    floating= [island for island in self.islands if island['boundary'] == False]
+    print "Connected cell groups= " + str(groupCount) + " thermal islands without a boundary= " + str(len(floating))
+    if len(floating) == 0:
+      return
+    floating.sort(key=lambda island: island['cells'], reverse=True)
+    for island in floating[:10]:
+      print "Warning: Thermal island " + str(island['label']) + " cells= " + str(island['cells']) + \
+        " heat= " + str(island['heat']) + " bbox= " + str(island['bbox'])
+    if len(floating) > 10:
+      print "Warning: " + str(len(floating) - 10) + " more thermal islands"
+    
+    if action == "drop":
+      drop= np.zeros(groupCount + 1, dtype = 'bool')
+      drop[[island['label'] for island in floating]]= True
+      dropped= drop[labels]
+      self.ifield[:, :, self._holeflag][dropped]= -1
+      self.ifield[:, :, self._island][dropped]= 0
+      print "Warning: Dropped " + str(int(dropped.sum())) + " thermal island cells with heat " + \
+        str(sum([island['heat'] for island in floating]))
+    
   def mapMeshToSolutionMatrix(self, lyr):
     """
     mapMeshToSolutionMatrix(Mesh self, Layers lyr)
@@ -187,22 +358,36 @@ class Mesh:
       print "Error: Width:" + str(self.width)
     if self.height <= 0:
       print "Error: Height:" + str(self.height)      
-    self.nodeCount= 0;
-    for xn in range(0,self.width):
-      for yn in range(0, self.height): 
-        if (self.ifield[xn, yn, self._holeflag] >= 0):
-          self.ifield[xn, yn, self._holeflag]= self.nodeCount
-          self.nodeCount += 1
-    self.nodeXn = np.zeros(self.nodeCount, dtype = 'int')
-    self.nodeYn = np.zeros(self.nodeCount, dtype = 'int')
-    for xn in range(0,self.width):
-      for yn in range(0, self.height):
-        nodeThis= self.ifield[xn, yn, self._holeflag]
-        if (nodeThis >= 0):
-          self.nodeXn[nodeThis]= xn
-          self.nodeYn[nodeThis]= yn   
+    # Nodes are numbered x-major, which is the C order of the (x, y) plane, so
+    # boolean mask assignment and nonzero() give the same numbering as nested x, y loops.
+    nodes= self.ifield[:, :, self._holeflag]
+    occupied= nodes >= 0
+    self.nodeCount= int(np.count_nonzero(occupied))
+    nodes[occupied]= np.arange(self.nodeCount)
+    self.nodeXn, self.nodeYn= np.nonzero(occupied)
     # self.nodeCount = self.getNodeAtXY(self.width - 1, self.height - 1) + 1
     print "Total number of independent nodes= ", self.nodeCount
+    print "Mesh layer memory= " + str(self.field.nbytes() + self.ifield.nbytes()) + " bytes"
+    
+  def edgeConductances(self):
+    """
+    edgeConductances(Mesh self)
+    Returns the conductances 2/(R1+R2) between neighboring cells as two arrays,
+    gx[w-1, h] between (x, y) and (x+1, y), and gy[w, h-1] between (x, y) and (x, y+1).
+    Pairs where either cell is a hole have zero conductance.
+    A mesh loaded from the mesh cache has them precomputed in self.edgeCache.
+    """
+    if self.edgeCache is not None:
+      return self.edgeCache
+    resis= self.field[:, :, self._resis]
+    nodes= self.ifield[:, :, self._holeflag]
+    gx= np.zeros((self.width - 1, self.height), dtype = 'double')
+    gy= np.zeros((self.width, self.height - 1), dtype = 'double')
+    pairs= (nodes[:-1, :] >= 0) & (nodes[1:, :] >= 0)
+    gx[pairs]= 2.0/(resis[:-1, :][pairs] + resis[1:, :][pairs])
+    pairs= (nodes[:, :-1] >= 0) & (nodes[:, 1:] >= 0)
+    gy[pairs]= 2.0/(resis[:, :-1][pairs] + resis[:, 1:][pairs])
+    return gx, gy
     
   def nodeLocation(self, node):
     if node < 0 or node >= self.nodeCount:
@@ -255,8 +440,12 @@ class Mesh:
     cures= 1.0/(cucond * cuthick)
     print "Cu Resistance per square: " + str(cures)      
     
+    fr4cap= self.heatCapacity('Core', 'core1', lyr, matls)
+    cucap= self.heatCapacity('Cu', 'topside_cu', lyr, matls)
+    
     self.setMeshSize(x, y)
     self.field[:, :, self._resis] = fr4res
+    self.field[:, :, self._cap] = fr4cap
     
     # Heat source
     hsx= 0.5
@@ -273,6 +462,7 @@ class Mesh:
     print "Heat per cell = ", heatPerCell
     self.field[srcl:srcr, srct:srcb, self._heat] = heatPerCell
     self.field[srcl:srcr, srct:srcb, self._resis] = cures
+    self.field[srcl:srcr, srct:srcb, self._cap] = cucap
     
     # Boundary conditions
     self.field[0, 0:self.height, self._isodeg] = 25.0
@@ -298,6 +488,8 @@ class Mesh:
     cond1b= round(self.height*hsy + self.height*condwidth*0.5)
     self.field[0:self.width, cond1t:cond1b, self._resis] = cures
     self.field[cond1l:cond1r, 0:self.height, self._resis] = cures
+    self.field[0:self.width, cond1t:cond1b, self._cap] = cucap
+    self.field[cond1l:cond1r, 0:self.height, self._cap] = cucap
     
     # Holes
     self.ifield[1, 1, self._holeflag]= -1
@@ -307,75 +499,110 @@ class Mesh:
   def definePNGProblem(self, fn, lyr, matls):
     """
     Read a PNG file and load the data structure
-    pix from Image module is getting mapped into field and ifield 2D layer structs.
-
+    The pixel colors are mapped in bulk through the palette table from the mesh configuration
+    into the field and ifield 2D layer structs.
+    Returns a dictionary with the number of pixels for each palette entry.
     """
-    heatPerCell= 48e-6
-    pngproblem = Image.open(fn, mode='r')
-    xysize= pngproblem.size
-    width= xysize[0]
-    height= xysize[1]
+    if 'palette' not in self.config:
+      print "Error: No palette in mesh configuration " + str(self.config_js_fn)
+      return {}
+    palette= Palette.Palette(self.config['palette'])
+    classes= palette.classify(fn)
+    width, height= classes.shape
     print "Width: " + str(width) + " Height: " + str(height)
     
-    fr4cond= matls.getProp('Core', 'conductivityXX')
-    fr4thick= lyr.getProp('core1', 'thickness')
-    fr4condUnits= matls.getUnits('conductivityXX')
-    fr4thickUnits= lyr.getUnits('thickness')
-    print "FR-4 Cond: " + str(fr4cond) + str(fr4condUnits)
-    print "FR-4 Thickness: " + str(fr4thick) + str(fr4thickUnits)
-    fr4res= 1.0/(fr4cond * fr4thick)
-    print "FR-4 Resistance per square: " + str(fr4res)
-    
-    cucond= matls.getProp('Cu', 'conductivity')
-    cuthick= lyr.getProp('topside_cu', 'thickness')
-    cucondUnits= matls.getUnits('conductivity')
-    cuthickUnits= lyr.getUnits('thickness')
-    print "Cu Cond: " + str(cucond) + str(cucondUnits)
-    print "Cu Thickness: " + str(cuthick) + str(cuthickUnits)
-    cures= 1.0/(cucond * cuthick)
-    print "Cu Resistance per square: " + str(cures)    
+    # Unrecognized colors get the default palette entry.
+    # Without a default they index the extra last table entry, which is a hole.
+    defaultIdx= palette.defaultIndex()
+    if defaultIdx >= 0:
+      classes[classes < 0]= defaultIdx
       
-    self.setMeshSize(width, height)
-    self.field[:, :, self._isodeg] = 25.0
-    self.field[:, :, self._resis] = fr4res
-    self.field[:, :, self._boundCond] = 0.0
+    # Property tables have one entry per palette color plus one for unrecognized colors.
+    entryCount= len(palette.entries) + 1
+    resisTable= np.zeros(entryCount, dtype = 'double')
+    heatTable= np.zeros(entryCount, dtype = 'double')
+    isodegTable= np.zeros(entryCount, dtype = 'double')
+    isodegTable.fill(25.0)
+    boundCondTable= np.zeros(entryCount, dtype = 'double')
+    capTable= np.zeros(entryCount, dtype = 'double')
+    isoflagTable= np.zeros(entryCount, dtype = 'int')
+    holeflagTable= np.zeros(entryCount, dtype = 'int')
+    holeflagTable[-1]= -1
+    for idx in range(0, len(palette.entries)):
+      entry= palette.entries[idx]
+      if entry.get('hole', 0) == 1:
+        holeflagTable[idx]= -1
+        continue
+      resisTable[idx]= self.paletteResistance(entry, lyr, matls)
+      capTable[idx]= self.heatCapacity(entry['matl'], entry['layer'], lyr, matls)
+      heatTable[idx]= float(entry.get('heat', 0.0))
+      if entry.get('isoflag', 0) == 1:
+        isoflagTable[idx]= 1
+        isodegTable[idx]= float(entry.get('isodeg', 25.0))
+        boundCondTable[idx]= matls.getProp(entry['boundMatl'], 'conductivityXX')
       
-    pix = pngproblem.load()
-    copperCellCount=0
-    heatCellCount=0
-    isoCellCount=0
-    fr4CellCount=0
-    holeCellCount=0
-    for xn in range(0,width):
-      for tyn in range(0, height):
-        # Graphing package has +y up, png has it down
-        yn= height - 1 - tyn
-        if pix[xn,yn][0] == 255 and pix[xn,yn][1] == 0 and pix[xn,yn][2]== 0: 
-          self.field[xn, tyn, self._resis] = cures
-          self.field[xn, tyn, self._heat] = heatPerCell
-          copperCellCount += 1
-          heatCellCount += 1
-        elif pix[xn,yn][0] == 0 and pix[xn,yn][1] == 255 and pix[xn,yn][2]== 0:
-          self.field[xn, tyn, self._resis] = cures
-          copperCellCount += 1
-        elif pix[xn,yn][0] == 0 and pix[xn,yn][1] == 0 and pix[xn,yn][2]== 255:
-          self.ifield[xn, tyn, self._isoflag] = 1
-          self.field[xn, tyn, self._resis] = cures
-          self.field[xn, tyn, self._isodeg] = 25.0
-          self.field[xn, tyn, self._boundCond] = cucond
-          isoCellCount += 1
-          copperCellCount += 1
-        elif pix[xn,yn][0] == 255 and pix[xn,yn][1] == 255 and pix[xn,yn][2]== 0:
-          self.field[xn, tyn, self._resis] = fr4res
-          fr4CellCount += 1
-        elif pix[xn,yn][0] == 255 and pix[xn,yn][1] == 255 and pix[xn,yn][2]== 255:
-          self.ifield[xn, tyn, self._holeflag] = -1
-          holeCellCount += 1
-        else:
-          print 'Unrecognized color: (' + str(pix[xn,yn][0]) + "," + str(pix[xn,yn][1]) + "," + str(pix[xn,yn][2]) + ') at: ' + str(xn) + ", " + str(yn)
-          
-    print "Copper px: " + str(copperCellCount) + " Heat px: " + str(heatCellCount) + " Iso px: " + str(isoCellCount)
-    print "FR4 px: " + str(fr4CellCount) + " Hole px: " + str(holeCellCount)
+    self.setMeshSize(width, height)
+    self.field[:, :, self._resis]= resisTable[classes]
+    self.field[:, :, self._heat]= heatTable[classes]
+    self.field[:, :, self._isodeg]= isodegTable[classes]
+    self.field[:, :, self._boundCond]= boundCondTable[classes]
+    self.field[:, :, self._cap]= capTable[classes]
+    self.ifield[:, :, self._isoflag]= isoflagTable[classes]
+    self.ifield[:, :, self._holeflag]= holeflagTable[classes]
+    
+    palette.printCounts()
+    self.pixelCounts= palette.counts
+    self.unknownColors= palette.unknownColors
+    return self.pixelCounts
+    
+  def definePNGHeat(self, fn):
+    """
+    definePNGHeat(Mesh self, string fn)
+    Read a PNG heat layer with the mesh palette and return the heat per cell,
+    shaped like self.field[:, :, self._heat]. Only the heat property of the palette is used.
+    Returns None if the PNG is not the size of the mesh.
+    """
+    palette= Palette.Palette(self.config['palette'])
+    classes= palette.classify(fn)
+    if classes.shape != (self.width, self.height):
+      print "Error: Heat layer " + str(fn) + " size " + str(classes.shape) + " does not match mesh " + str((self.width, self.height))
+      return None
+    defaultIdx= palette.defaultIndex()
+    if defaultIdx >= 0:
+      classes[classes < 0]= defaultIdx
+    heatTable= np.zeros(len(palette.entries) + 1, dtype = 'double')
+    for idx in range(0, len(palette.entries)):
+      heatTable[idx]= float(palette.entries[idx].get('heat', 0.0))
+    return heatTable[classes]
+    
+  def paletteResistance(self, entry, lyr, matls):
+    """
+    paletteResistance(Mesh self, dict entry, Layers lyr, Matls matls)
+    Resistance per square of the material and layer named in a palette entry.
+    """
+    cond= matls.getProp(entry['matl'], 'conductivityXX')
+    thick= lyr.getProp(entry['layer'], 'thickness')
+    res= 1.0/(cond * thick)
+    print entry['name'] + ": " + str(entry['matl']) + " " + str(cond) + str(matls.getUnits('conductivityXX')) + \
+      " in " + str(entry['layer']) + " " + str(thick) + str(lyr.getUnits('thickness')) + \
+      " Resistance per square: " + str(res)
+    return res
+    
+  def heatCapacity(self, matlName, layerName, lyr, matls):
+    """
+    heatCapacity(Mesh self, string matlName, string layerName, Layers lyr, Matls matls)
+    Heat capacity in J/K of one square cell of material matlName with the thickness of layer layerName.
+    The cell is self.pixelPitch meters on a side.
+    Density is in gm/cc and specific heat in J/gm-K, so their product is multiplied by 1e6 to get J/m^3-K.
+    Materials without density or specific heat have zero heat capacity.
+    """
+    density= matls.getProp(matlName, 'density')
+    specificHeat= matls.getProp(matlName, 'specific_heat')
+    thick= lyr.getProp(layerName, 'thickness')
+    if density == '-' or specificHeat == '-':
+      print "Warning: No density or specific heat for " + str(matlName) + ", heat capacity is zero"
+      return 0.0
+    return density * specificHeat * 1.0e6 * thick * self.pixelPitch * self.pixelPitch
     
   def defineTinyProblem(self, lyr, matls):
     """ 
@@ -388,6 +615,7 @@ class Mesh:
     self.ifield[0:3, 0, self._isoflag] = 1
     self.field[0:3, 0, self._boundCond] = 400.0
     self.field[1, 1, self._heat]    = 2.0
+    self.field[:, :, self._cap]     = 1.0
     print "Mesh: " + str(self)
     
   def defineProblem(self, config, lyr, matls):
@@ -407,14 +635,37 @@ class Mesh:
       print "Problem not specified or not found in configuration"
       
   def loadConfig(self, config):
+    # Size of a square mesh cell in meters, only used for heat capacity.
+    self.pixelPitch= config.get('pixelPitch', 1.0e-4)
+    # Directory for memory-mapped mesh layers, or '' to keep the layers in memory.
+    self.runDirectory= config.get('runDirectory', '')
+    self.reopenRun= False
+    # Content-addressed cache of meshed problems, shared between runs.
+    self.meshCache= None
+    if 'meshCache' in config:
+      self.meshCache= MeshCache.MeshCache(config['meshCache']['directory'],
+                                          int(config['meshCache'].get('maxMegabytes', 2000) * 1024 * 1024))
     self.numdoublelayers= 0
     self.numintlayers= 0
+    # Layers can have an optional storage type, such as uint8 for flags or float32 for outputs.
+    doubleStorage= {}
+    intStorage= {}
+    doubleNames= {}
+    intNames= {}
     for lyr in config['simulation_layers']:
       self.__dict__['_' + lyr['name']]= lyr['index']
       if (lyr['type'] == 'double'):
         self.numdoublelayers = self.numdoublelayers + 1
+        doubleStorage[lyr['index']]= lyr.get('storage', 'float64')
+        doubleNames[lyr['index']]= lyr['name']
       if (lyr['type'] == 'int'):
         self.numintlayers = self.numintlayers + 1 
+        intStorage[lyr['index']]= lyr.get('storage', 'int64')
+        intNames[lyr['index']]= lyr['name']
+    self.doubleStorage= [doubleStorage[idx] for idx in range(0, self.numdoublelayers)]
+    self.intStorage= [intStorage[idx] for idx in range(0, self.numintlayers)]
+    self.doubleNames= [doubleNames[idx] for idx in range(0, self.numdoublelayers)]
+    self.intNames= [intNames[idx] for idx in range(0, self.numintlayers)]
     print "Number of double layers = " + str(self.numdoublelayers)
     print "Number of int layers = " + str(self.numintlayers)
           
\ No newline at end of file
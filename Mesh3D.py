@@ -1,17 +1,13 @@
 import numpy as np
-class Mesh3D:
-  
-  def __init__(self):
-    self.width= 1.0
-    self.height= 1.0
-    self.thickness= .059
-    self.layers= 2
-    
-  def addLayer(self, layerName, fileName):
-    
-
+import scipy.sparse as sparse
+import scipy.ndimage as ndimage
+import yaml
+import multiprocessing
+import Palette
+from PIL import Image
 
-    """
+class Mesh3D:
+  """
   Mesh3D: Square multilayer mesher class for multilayer planar thermal analysis
   
   Don't forget to order layer descriptions from top down.
@@ -78,6 +74,22 @@ class Mesh3D:
   An adjacency list does not know its shape. It only knows about pairs of bricks.
   The challenge with adjacency is to make it efficient to loop through the matrix
   rows and find the adjacency relationships to the other rows.
+
+  Implementation:
+    The stackup to mesh is the "mesh3d" section of the mesh configuration, with one PNG per
+    stackup layer, top down. The PNG pixels are classified by the mesh palette, as in Mesh2D.
+    Brick properties are looked up from the palette entry of the brick in self.cls[x, y, z]
+    and tables indexed by palette entry and layer, so a brick costs a few bytes.
+    The brick z thickness and centroid come from Layers.calculateLayerZCoords.
+    self.row[x, y, z] is the matrix row of a brick, -1 for empty, numbered z-major.
+    The stencil adjacency is three conductance arrays gx, gy, gz, one per face direction,
+    from the anisotropic conductivityXX, YY, ZZ of the brick materials.
+    The 7-point conductance matrix is assembled in bulk from the stencil arrays.
+    A layer can be homogenized, with the copper specified by the coverage of the layer instead of
+    its traces, and coarsened to bricks of N x N pixels, so inner planes and signal layers are meshed
+    much coarser than the top layer. A coarse brick has one temperature, so where it touches the
+    copper of a fine layer it shorts that copper over N pixels. Keep the dielectric next to the
+    fine layers fine, the coarse layers then change the temperatures by about a percent of the rise.
   """
   
   
@@ -122,6 +134,419 @@ class Mesh3D:
       the anisotropic case is handled as a different material.
     Thermal conductivity is stored in for the adjacency
 """
+
+  def __init__(self, fn, lyr, matls):
+    self.config_js_fn= fn
+    with open (self.config_js_fn, "r") as jsonHandle:
+      jsonContents= jsonHandle.read()
+    config= yaml.load(jsonContents)
+    self.config= config
+    self.pixelPitch= config.get('pixelPitch', 1.0e-4)
+    self.lyr= lyr
+    self.matls= matls
+    
+    self.assembled= None
+    self.defineStackup(config['mesh3d'], lyr, matls)
+    processes= config['mesh3d'].get('processes', 0)
+    if processes > 0:
+      self.assembleLayers(processes, config.get('islandAction', 'drop'))
+    else:
+      self.setClasses([layerClasses(self.layerArgs(z)) for z in range(0, self.depth)])
+      self.findThermalIslands(config.get('islandAction', 'drop'))
+      self.mapMeshToSolutionMatrix()
+      self.edgeConductances()
+    
+  def defineStackup(self, config, lyr, matls):
+    """
+    defineStackup(Mesh3D self, config, Layers lyr, Matls matls)
+    Build the property tables for one PNG per stackup layer, top down.
+    config['layers'] is a list of { "layer": stackup layer name, "inputFile": PNG file,
+    "background": material, "homogenize": 0 or 1, "coarsen": N } where background is the material
+    of the pixels that get the default palette entry, which defaults to the material of the stackup layer.
+    The other palette entries give the material, heat and boundary condition of their bricks.
+    A heat or boundary condition entry only applies in the stackup layer named by its "layer",
+    in the other layers its pixels are background without heat or boundary condition, so a heat
+    source drawn in several layer PNGs is only counted once.
+    The brick properties are not stored per brick, instead self.cls[x, y, z] holds the palette
+    entry of each brick, and the properties come from tables indexed by palette entry and layer.
+    
+    With homogenize, the background is a mix of the layer material and the material of the layer
+    that it displaces, in proportion to the coverage of the layer in the stackup. The inputFile
+    can then be left out, and the whole layer is background. A layer specified by percent copper
+    instead of its traces is homogenize 1 without an inputFile.
+    With coarsen N, the bricks of the layer are N x N pixels. See mapMeshToSolutionMatrix.
+    With config['processes'] greater than zero, the layers are meshed and assembled in a process pool.
+    """
+    palette= Palette.Palette(self.config['palette'])
+    self.layerConfig= config['layers']
+    self.layerNames= [layer['layer'] for layer in config['layers']]
+    self.depth= len(self.layerNames)
+    self.coarsen= np.array([layer.get('coarsen', 1) for layer in config['layers']], dtype = 'int32')
+    entryCount= len(palette.entries) + 1
+    defaultIdx= palette.defaultIndex()
+    self.defaultIdx= max(defaultIdx, -1)
+    artwork= [layer['inputFile'] for layer in config['layers'] if 'inputFile' in layer]
+    if len(artwork) == 0:
+      print "Error: No inputFile in the mesh3d layers, the layer size is unknown"
+      return
+    self.width, self.height= Image.open(artwork[0]).size
+    
+    # Materials used in the mesh, and the material, heat and boundary condition of each palette entry in each layer.
+    self.matlNames= []
+    self.kXX= []
+    self.kYY= []
+    self.kZZ= []
+    self.matlTable= np.zeros((entryCount, self.depth), dtype = 'int16')
+    self.matlTable.fill(-1)
+    self.heatTable= np.zeros((entryCount, self.depth), dtype = 'double')
+    self.isoflagTable= np.zeros((entryCount, self.depth), dtype = 'uint8')
+    self.isodegTable= np.zeros((entryCount, self.depth), dtype = 'double')
+    self.isodegTable.fill(25.0)
+    self.boundCondTable= np.zeros((entryCount, self.depth), dtype = 'double')
+    for z in range(0, self.depth):
+      layer= config['layers'][z]
+      background= layer.get('background', lyr.getProp(layer['layer'], 'matl'))
+      if layer.get('homogenize', 0) == 1:
+        background= self.homogenizedMaterial(layer['layer'], background, lyr, matls)
+      for idx in range(0, len(palette.entries)):
+        entry= palette.entries[idx]
+        if entry.get('hole', 0) == 1:
+          continue
+        matlName= entry['matl']
+        source= 'heat' in entry or entry.get('isoflag', 0) == 1
+        if idx == defaultIdx or (source and entry.get('layer', layer['layer']) != layer['layer']):
+          self.matlTable[idx, z]= self.materialIndex(background, matls)
+          continue
+        self.matlTable[idx, z]= self.materialIndex(matlName, matls)
+        self.heatTable[idx, z]= float(entry.get('heat', 0.0))
+        if entry.get('isoflag', 0) == 1:
+          self.isoflagTable[idx, z]= 1
+          self.isodegTable[idx, z]= float(entry.get('isodeg', 25.0))
+          self.boundCondTable[idx, z]= matls.getProp(entry['boundMatl'], 'conductivityXX')
+    self.kXX= np.array(self.kXX, dtype = 'double')
+    self.kYY= np.array(self.kYY, dtype = 'double')
+    self.kZZ= np.array(self.kZZ, dtype = 'double')
+    
+    self.thickness= np.array([lyr.getProp(name, 'thickness') for name in self.layerNames], dtype = 'double')
+    self.zCoords= np.array([0.5 * (lyr.getProp(name, 'z_top') + lyr.getProp(name, 'z_bottom')) for name in self.layerNames],
+                           dtype = 'double')
+    
+  def materialIndex(self, matlName, matls):
+    """
+    materialIndex(Mesh3D self, string matlName, Matls matls)
+    Index of a material in self.matlNames, adding it with its conductivities if it is new.
+    """
+    if matlName not in self.matlNames:
+      self.matlNames.append(matlName)
+      self.kXX.append(matls.getProp(matlName, 'conductivityXX'))
+      self.kYY.append(matls.getProp(matlName, 'conductivityYY'))
+      self.kZZ.append(matls.getProp(matlName, 'conductivityZZ'))
+    return self.matlNames.index(matlName)
+    
+  def homogenizedMaterial(self, layerName, matlName, lyr, matls):
+    """
+    homogenizedMaterial(Mesh3D self, string layerName, string matlName, Layers lyr, Matls matls)
+    Add the effective material of a layer with partial coverage and return its name.
+    The layer material, typically copper, covers the fraction coverage of the layer and the rest is
+    filled by the material of the layer it displaces, typically prepreg, as in Layers.calculateBoardThickness.
+    The copper and the fill are side by side and both span the layer thickness, so the through-plane
+    conductances of the two are in parallel, and the effective conductivity is the coverage-weighted mean.
+    In-plane the same mean assumes that the copper is connected across the layer, as in a plane
+    with clearances, and is an upper bound for isolated traces.
+    """
+    coverage= lyr.getProp(layerName, 'coverage')
+    if coverage == '-' or coverage == '':
+      coverage= 1.0
+    coverage= float(coverage)
+    fillLayer= lyr.getProp(layerName, 'displaces')
+    if fillLayer == '-' or fillLayer == '':
+      fillName= matlName
+    else:
+      fillName= lyr.getProp(fillLayer, 'matl')
+    name= matlName + '/' + fillName + '@' + str(coverage)
+    if name not in self.matlNames:
+      self.matlNames.append(name)
+      for k, prop in [(self.kXX, 'conductivityXX'), (self.kYY, 'conductivityYY'), (self.kZZ, 'conductivityZZ')]:
+        k.append(coverage * matls.getProp(matlName, prop) + (1.0 - coverage) * matls.getProp(fillName, prop))
+      print "Homogenized " + layerName + ": " + name + " conductivity XX, YY, ZZ= " + \
+        str((self.kXX[-1], self.kYY[-1], self.kZZ[-1]))
+    return name
+    
+  def setClasses(self, layerClasses):
+    """
+    setClasses(Mesh3D self, list layerClasses)
+    Stack the classified layer PNGs, top down, into self.cls[x, y, z] and build the spatial index.
+    """
+    print "Width: " + str(self.width) + " Height: " + str(self.height) + " Layers: " + str(self.depth)
+    self.cls= np.zeros((self.width, self.height, self.depth), dtype = 'int16')
+    for z in range(0, self.depth):
+      if layerClasses[z].shape != (self.width, self.height):
+        print "Error: Layer " + self.layerNames[z] + " " + self.layerConfig[z].get('inputFile', '') + " size " + \
+          str(layerClasses[z].shape) + " does not match " + str((self.width, self.height))
+        continue
+      self.cls[:, :, z]= layerClasses[z]
+    
+    # Spatial index: brick centroid coordinates in meters.
+    self.xCoords= (np.arange(self.width) + 0.5) * self.pixelPitch
+    self.yCoords= (np.arange(self.height) + 0.5) * self.pixelPitch
+    
+  def brickMaterials(self):
+    """
+    brickMaterials(Mesh3D self)
+    Material index of every pixel of every layer, -1 for empty pixels.
+    """
+    return self.matlTable[self.cls, self.layerIndex()]
+    
+  def layerIndex(self):
+    """
+    layerIndex(Mesh3D self)
+    Layer number z broadcast against self.cls, for looking up the per-layer palette tables.
+    """
+    return np.arange(self.depth, dtype = 'int16')[np.newaxis, np.newaxis, :]
+    
+  def brickOccupancy(self):
+    """
+    brickOccupancy(Mesh3D self)
+    True for the pixels that are part of a brick. In a coarsened layer, all the pixels
+    of a brick are part of it, including empty pixels, if any of its pixels has a material.
+    """
+    matl= self.brickMaterials()
+    occupied= np.zeros(matl.shape, dtype = 'bool')
+    for z in range(0, self.depth):
+      occupied[:, :, z]= blockOccupancy(matl[:, :, z], self.coarsen[z])
+    return occupied
+    
+  def findThermalIslands(self, action):
+    """
+    findThermalIslands(Mesh3D self, string action)
+    Label the face-connected groups of bricks. Groups without a boundary condition brick are
+    thermal islands, which make the matrix singular. action "drop" empties their bricks.
+    Returns the number of dropped pixels.
+    """
+    occupied= self.brickOccupancy()
+    labels, groupCount= ndimage.label(occupied)
+    boundary= np.bincount(labels.ravel(), weights=self.isoflagTable[self.cls, self.layerIndex()].ravel(), minlength=groupCount + 1)
+    floating= np.nonzero(boundary[1:] == 0)[0] + 1
+    print "Connected brick groups= " + str(groupCount) + " thermal islands without a boundary= " + str(len(floating))
+    if len(floating) > 0 and action == "drop":
+      drop= np.zeros(groupCount + 1, dtype = 'bool')
+      drop[floating]= True
+      dropped= drop[labels]
+      self.cls[dropped]= -1
+      print "Warning: Dropped " + str(int(dropped.sum())) + " thermal island pixels"
+      return int(dropped.sum())
+    return 0
+    
+  def mapMeshToSolutionMatrix(self):
+    """
+    mapMeshToSolutionMatrix(Mesh3D self)
+    Number the occupied bricks z-major: all of the bricks of the top layer, then the next layer down.
+    Within a layer the numbering is x-major like the 2D mesh.
+    self.row[x, y, z] is the matrix row of the brick at pixel x, y of layer z, or -1 if there is no brick.
+    A brick of a layer with coarsen N covers N x N pixels, which all have the row of the brick.
+    self.nodeXn, self.nodeYn, self.nodeZn are the brick locations of each row, the first pixel of a coarse brick.
+    self.layerStart[z] is the first row of layer z.
+    """
+    matl= self.brickMaterials()
+    self.row= np.empty((self.width, self.height, self.depth), dtype = 'int32')
+    nodeX= []
+    nodeY= []
+    self.layerStart= np.zeros(self.depth + 1, dtype = 'int64')
+    for z in range(0, self.depth):
+      row, xn, yn= layerRowMap(matl[:, :, z], self.coarsen[z])
+      self.row[:, :, z]= np.where(row >= 0, row + self.layerStart[z], -1)
+      nodeX.append(xn)
+      nodeY.append(yn)
+      self.layerStart[z + 1]= self.layerStart[z] + len(xn)
+    self.nodeXn= np.concatenate(nodeX)
+    self.nodeYn= np.concatenate(nodeY)
+    self.nodeZn= np.repeat(np.arange(self.depth), np.diff(self.layerStart))
+    self.nodeCount= int(self.layerStart[-1])
+    print "Total number of independent nodes= ", self.nodeCount
+    
+  def edgeConductances(self):
+    """
+    edgeConductances(Mesh3D self)
+    The stencil conductances between face neighbors, in W/K:
+      gx[w-1, h, d] between (x, y, z) and (x+1, y, z)
+      gy[w, h-1, d] between (x, y, z) and (x, y+1, z)
+      gz[w, h, d-1] between (x, y, z) and (x, y, z+1)
+    Each brick contributes a half-brick conductance from its center to the face,
+    k * face area / (length/2), using conductivityXX, YY or ZZ of its material for the direction.
+    The two halves are in series. Pairs with an empty brick have zero conductance.
+    The x and y half-brick conductance of a square brick is 2 k thickness, so in-plane
+    this is the same as 2/(R1+R2) with the resistance per square R of the 2D mesh.
+    
+    The conductances are per pixel. Between two bricks of a coarsened layer, the N pixel pairs
+    on their shared face are in parallel, each with 1/N of its pixel conductance, so the brick
+    conductance is the mean of the pixel pair conductances, which keeps the copper that crosses
+    the face. The pixel pairs inside a coarse brick have zero conductance.
+    Through-plane, each pixel column is a separate conductance, so a coarse brick couples to each
+    of the bricks above and below it in proportion to their overlap.
+    """
+    rx, ry, rz= halfResistances(self.brickMaterials(), self.kXX, self.kYY, self.kZZ,
+                                self.thickness[np.newaxis, np.newaxis, :], self.pixelPitch,
+                                self.coarsen[np.newaxis, np.newaxis, :])
+    self.gx= 1.0 / (rx[:-1, :, :] + rx[1:, :, :])
+    self.gy= 1.0 / (ry[:, :-1, :] + ry[:, 1:, :])
+    self.gz= 1.0 / (rz[:, :, :-1] + rz[:, :, 1:])
+    self.gx[self.row[:-1, :, :] == self.row[1:, :, :]]= 0.0
+    self.gy[self.row[:, :-1, :] == self.row[:, 1:, :]]= 0.0
+    return self.gx, self.gy, self.gz
+    
+  def layerArgs(self, z):
+    """
+    layerArgs(Mesh3D self, int z)
+    The inputs of assembleLayerBlock for layer z, only the tables of that layer are sent to the worker.
+    """
+    return { 'palette': self.config['palette'], 'inputFile': self.layerConfig[z].get('inputFile', ''),
+             'shape': (self.width, self.height), 'defaultIdx': self.defaultIdx, 'coarsen': self.coarsen[z],
+             'matlColumn': self.matlTable[:, z], 'kXX': self.kXX, 'kYY': self.kYY, 'kZZ': self.kZZ,
+             'heatTable': self.heatTable[:, z], 'isoflagTable': self.isoflagTable[:, z],
+             'isodegTable': self.isodegTable[:, z], 'boundCondTable': self.boundCondTable[:, z],
+             'thickness': self.thickness[z], 'pixelPitch': self.pixelPitch }
+    
+  def assembleLayers(self, processes, action):
+    """
+    assembleLayers(Mesh3D self, int processes, string action)
+    Parallel mesh and matrix assembly.
+    Each worker of a pool of processes reads one layer PNG and assembles the in-plane block of the
+    matrix for that layer, with layer-relative row numbers. When the blocks are done, the layer
+    row offsets are known, and the vertical coupling of each pair of adjacent layers is calculated
+    from the row maps and through-plane half resistances that the layer workers return,
+    so each PNG is read and classified once. The workers do not print the palette counts.
+    The blocks are stitched into a block diagonal matrix and the coupling terms are added.
+    The rows are numbered the same way as mapMeshToSolutionMatrix, so the result is the same
+    matrix as assembleSparseMatrix. Thermal islands are dropped by removing their rows.
+    """
+    layerArgs= [dict(self.layerArgs(z), printCounts=False) for z in range(0, self.depth)]
+    pool= multiprocessing.Pool(processes)
+    blocks= pool.map(assembleLayerBlock, layerArgs, chunksize=1)
+    pool.close()
+    pool.join()
+    couplings= [coupleLayerPair(blocks[z], blocks[z + 1]) for z in range(0, self.depth - 1)]
+    self.setClasses([block['classes'] for block in blocks])
+    
+    # Block diagonal matrix of the layer blocks, with the layer blocks' CSR arrays shifted by the row offsets.
+    offsets= np.concatenate(([0], np.cumsum([len(block['b']) for block in blocks])))
+    nnzOffsets= np.concatenate(([0], np.cumsum([block['block'].nnz for block in blocks])))
+    nodeCount= offsets[-1]
+    indptr= np.concatenate([np.zeros(1, dtype = 'int64')] +
+                           [block['block'].indptr[1:] + nnzOffsets[z] for z, block in enumerate(blocks)])
+    indices= np.concatenate([block['block'].indices + offsets[z] for z, block in enumerate(blocks)])
+    data= np.concatenate([block['block'].data for block in blocks])
+    A= sparse.csr_matrix((data, indices, indptr), shape=(nodeCount, nodeCount))
+    b= np.concatenate([block['b'] for block in blocks])
+    
+    if (self.coarsen == 1).all():
+      # Each row has at most one coupling to the layer above and one to the layer below.
+      # Those columns are before and after all of the columns of the layer, so the
+      # coupling matrix is built directly in CSR form with sorted columns, without a sort.
+      cols= np.zeros((nodeCount, 3), dtype = 'int64')
+      vals= np.zeros((nodeCount, 3), dtype = 'double')
+      cols[:, 1]= np.arange(nodeCount)
+      for z in range(0, self.depth - 1):
+        rowAbove, rowBelow, g= couplings[z]
+        rowAbove= rowAbove + offsets[z]
+        rowBelow= rowBelow + offsets[z + 1]
+        cols[rowAbove, 2]= rowBelow
+        vals[rowAbove, 2]= -g
+        vals[rowAbove, 1] += g
+        cols[rowBelow, 0]= rowAbove
+        vals[rowBelow, 0]= -g
+        vals[rowBelow, 1] += g
+      used= vals != 0.0
+      used[:, 1]= True
+      coupling= sparse.csr_matrix((vals[used], cols[used], np.concatenate(([0], np.cumsum(used.sum(1))))),
+                                  shape=(nodeCount, nodeCount))
+    else:
+      # A coarse brick couples to many bricks of the adjacent layer, one term per pixel column.
+      rows= []
+      cols= []
+      vals= []
+      for z in range(0, self.depth - 1):
+        rowAbove, rowBelow, g= couplings[z]
+        rowAbove= rowAbove + offsets[z]
+        rowBelow= rowBelow + offsets[z + 1]
+        rows += [rowAbove, rowBelow, rowAbove, rowBelow]
+        cols += [rowBelow, rowAbove, rowAbove, rowBelow]
+        vals += [-g, -g, g, g]
+      coupling= sparse.coo_matrix((np.concatenate(vals), (np.concatenate(rows), np.concatenate(cols))),
+                                  shape=(nodeCount, nodeCount)).tocsr()
+    A= A + coupling
+    
+    matl= self.brickMaterials()
+    if self.findThermalIslands(action) > 0:
+      self.mapMeshToSolutionMatrix()
+      keep= []
+      for z in range(0, self.depth):
+        row, xn, yn= layerRowMap(matl[:, :, z], self.coarsen[z])
+        keepLayer= np.zeros(len(xn), dtype = 'bool')
+        keepLayer[row[self.row[:, :, z] >= 0]]= True
+        keep.append(keepLayer)
+      keep= np.concatenate(keep)
+      A= A[keep][:, keep]
+      b= b[keep]
+    else:
+      self.mapMeshToSolutionMatrix()
+    self.assembled= (A, b)
+    print "Assembled " + str(self.depth) + " layers with " + str(processes) + " processes, nonzeros= " + str(A.nnz)
+    
+  def assembleSparseMatrix(self, damping=0.0):
+    """
+    assembleSparseMatrix(Mesh3D self, float damping)
+    Bulk assembly of the 7-point conductance matrix A and the RHS b in matrix row order.
+    The diagonal is the sum of the stencil conductances, plus the boundary conductance
+    of boundary bricks, which also get the Norton current source isodeg * boundCond in b.
+    The pixels of a coarse brick are summed into its row, so its heat and boundary conductance
+    are the totals over its pixels, and it couples to each neighbor brick by the sum of its pixel pairs.
+    If the matrix was assembled in parallel when meshing, that matrix is returned.
+    """
+    if self.assembled is not None:
+      A, b= self.assembled
+      if damping != 0.0:
+        A= A + damping * sparse.identity(self.nodeCount, format='csr')
+      return A, b
+    
+    diag= np.zeros((self.width, self.height, self.depth), dtype = 'double')
+    diag[:-1, :, :] += self.gx
+    diag[1:, :, :]  += self.gx
+    diag[:, :-1, :] += self.gy
+    diag[:, 1:, :]  += self.gy
+    diag[:, :, :-1] += self.gz
+    diag[:, :, 1:]  += self.gz
+    
+    occupied= self.row >= 0
+    pixelRow= self.row[occupied]
+    cls= self.cls[occupied]
+    z= np.nonzero(occupied)[2]
+    boundCond= np.where(self.isoflagTable[cls, z] == 1, self.boundCondTable[cls, z], 0.0)
+    b= np.bincount(pixelRow, weights=self.heatTable[cls, z] + boundCond * self.isodegTable[cls, z], minlength=self.nodeCount)
+    
+    rows= [np.arange(self.nodeCount, dtype = 'int32')]
+    cols= [rows[0]]
+    vals= [np.bincount(pixelRow, weights=diag[occupied] + boundCond, minlength=self.nodeCount) + damping]
+    for axis, g in enumerate([self.gx, self.gy, self.gz]):
+      rowLo, rowHi, gPair= stencilPairs(self.row, g, axis)
+      rows += [rowLo, rowHi]
+      cols += [rowHi, rowLo]
+      vals += [-gPair, -gPair]
+    A= sparse.coo_matrix((np.concatenate(vals), (np.concatenate(rows), np.concatenate(cols))),
+                         shape=(self.nodeCount, self.nodeCount)).tocsr()
+    return A, b
+    
+  def loadSolution(self, x):
+    """
+    loadSolution(Mesh3D self, ndarray x)
+    Temperature of every pixel of every layer as an array [width, height, depth], NaN where there is no brick.
+    """
+    deg= np.empty((self.width, self.height, self.depth), dtype = 'float32')
+    deg.fill(np.nan)
+    occupied= self.row >= 0
+    deg[occupied]= x[self.row[occupied]]
+    return deg
+  
+
   
 """  
   A brick has: 
@@ -199,4 +624,157 @@ class Mesh3D:
   Holes can be one or more layers, allowing for blind vias or milling, for example.
   
   (s) Optional fields for when spice is in use.
-  """
\ No newline at end of file
+  """
+
+def classifyLayer(paletteConfig, fn, printCounts=True):
+  """
+  classifyLayer(dict paletteConfig, string fn, bool printCounts)
+  Palette entry of each pixel of the layer PNG fn, as int16.
+  Unrecognized colors get the default palette entry.
+  Without a default they index the extra last table entry, which is empty.
+  """
+  palette= Palette.Palette(paletteConfig)
+  classes= palette.classify(fn)
+  defaultIdx= palette.defaultIndex()
+  if defaultIdx >= 0:
+    classes[classes < 0]= defaultIdx
+  if printCounts:
+    palette.printCounts()
+  return classes.astype('int16')
+
+def layerClasses(args):
+  """
+  layerClasses(dict args)
+  Palette entries of a layer from Mesh3D.layerArgs. A layer without an inputFile is all default entry.
+  """
+  if args['inputFile'] == '':
+    classes= np.empty(args['shape'], dtype = 'int16')
+    classes.fill(args['defaultIdx'])
+    return classes
+  return classifyLayer(args['palette'], args['inputFile'], args.get('printCounts', True))
+
+def blockOccupancy(matl, coarsen):
+  """
+  blockOccupancy(ndarray matl, int coarsen)
+  True for the pixels of a layer that are part of a brick, for bricks of coarsen x coarsen pixels.
+  A brick exists if any of its pixels has a material.
+  """
+  occupied= matl >= 0
+  if coarsen == 1:
+    return occupied
+  width, height= matl.shape
+  blockWidth= (width + coarsen - 1) // coarsen
+  blockHeight= (height + coarsen - 1) // coarsen
+  padded= np.zeros((blockWidth * coarsen, blockHeight * coarsen), dtype = 'bool')
+  padded[:width, :height]= occupied
+  blocks= padded.reshape(blockWidth, coarsen, blockHeight, coarsen).any(3).any(1)
+  return blocks.repeat(coarsen, 0).repeat(coarsen, 1)[:width, :height]
+
+def layerRowMap(matl, coarsen):
+  """
+  layerRowMap(ndarray matl, int coarsen)
+  Number the bricks of a layer x-major from zero.
+  Returns the row of each pixel, -1 for no brick, and the first pixel xn, yn of each brick.
+  """
+  width, height= matl.shape
+  blocks= blockOccupancy(matl, coarsen)[::coarsen, ::coarsen]
+  bx, by= np.nonzero(blocks)
+  blockRow= np.empty(blocks.shape, dtype = 'int32')
+  blockRow.fill(-1)
+  blockRow[bx, by]= np.arange(len(bx), dtype = 'int32')
+  if coarsen > 1:
+    blockRow= blockRow.repeat(coarsen, 0).repeat(coarsen, 1)[:width, :height]
+  return blockRow, bx * coarsen, by * coarsen
+
+def halfResistances(matl, kXX, kYY, kZZ, thick, pitch, coarsen=1):
+  """
+  halfResistances(ndarray matl, ndarray kXX, ndarray kYY, ndarray kZZ, thick, float pitch, coarsen)
+  Thermal resistance from the center of each brick to its x, y and z faces, per pixel,
+  infinite for empty pixels with material -1. thick and coarsen are broadcast against matl.
+  The in-plane resistances of a pixel in a coarse brick are coarsen times those of a square brick,
+  because the coarse brick's face is shared by coarsen pixels.
+  """
+  empty= matl < 0
+  matl= np.where(empty, 0, matl)
+  with np.errstate(divide='ignore'):
+    rx= np.where(empty, np.inf, coarsen / (2.0 * kXX[matl] * thick))
+    ry= np.where(empty, np.inf, coarsen / (2.0 * kYY[matl] * thick))
+    rz= np.where(empty, np.inf, thick / (2.0 * kZZ[matl] * pitch * pitch))
+  return rx, ry, rz
+
+def stencilPairs(row, g, axis):
+  """
+  stencilPairs(ndarray row, ndarray g, int axis)
+  Rows, columns and conductances of the occupied neighbor pairs along axis of the row map.
+  Pairs of pixels in the same coarse brick are left out.
+  """
+  lo= [slice(None)] * row.ndim
+  hi= [slice(None)] * row.ndim
+  lo[axis]= slice(None, -1)
+  hi[axis]= slice(1, None)
+  rowLo= row[tuple(lo)]
+  rowHi= row[tuple(hi)]
+  pairs= (rowLo >= 0) & (rowHi >= 0) & (rowLo != rowHi)
+  return rowLo[pairs], rowHi[pairs], g[pairs]
+
+def layerBricks(args):
+  """
+  layerBricks(dict args)
+  Classify one layer PNG and number its bricks x-major from zero.
+  Returns the classes, the layer-relative row map, the brick locations xn, yn, and the half resistances.
+  """
+  classes= layerClasses(args)
+  matl= args['matlColumn'][classes]
+  rx, ry, rz= halfResistances(matl, args['kXX'], args['kYY'], args['kZZ'], args['thickness'], args['pixelPitch'],
+                              args['coarsen'])
+  row, xn, yn= layerRowMap(matl, args['coarsen'])
+  return classes, row, xn, yn, rx, ry, rz
+
+def assembleLayerBlock(args):
+  """
+  assembleLayerBlock(dict args)
+  Process pool worker for Mesh3D.assembleLayers.
+  Classify one layer PNG and assemble the in-plane block of the matrix and the RHS for the layer,
+  with the bricks numbered x-major from zero. args is from Mesh3D.layerArgs.
+  Returns the classes, the block, the RHS, and the row map and through-plane half resistances
+  for coupleLayerPair.
+  """
+  classes, row, xn, yn, rx, ry, rz= layerBricks(args)
+  count= len(xn)
+  gx= 1.0 / (rx[:-1, :] + rx[1:, :])
+  gy= 1.0 / (ry[:, :-1] + ry[:, 1:])
+  gx[row[:-1, :] == row[1:, :]]= 0.0
+  gy[row[:, :-1] == row[:, 1:]]= 0.0
+  
+  diag= np.zeros(classes.shape, dtype = 'double')
+  diag[:-1, :] += gx
+  diag[1:, :]  += gx
+  diag[:, :-1] += gy
+  diag[:, 1:]  += gy
+  occupied= row >= 0
+  pixelRow= row[occupied]
+  cls= classes[occupied]
+  boundCond= np.where(args['isoflagTable'][cls] == 1, args['boundCondTable'][cls], 0.0)
+  b= np.bincount(pixelRow, weights=args['heatTable'][cls] + boundCond * args['isodegTable'][cls], minlength=count)
+  
+  rows= [np.arange(count, dtype = 'int32')]
+  cols= [rows[0]]
+  vals= [np.bincount(pixelRow, weights=diag[occupied] + boundCond, minlength=count)]
+  for axis, g in enumerate([gx, gy]):
+    rowLo, rowHi, gPair= stencilPairs(row, g, axis)
+    rows += [rowLo, rowHi]
+    cols += [rowHi, rowLo]
+    vals += [-gPair, -gPair]
+  block= sparse.coo_matrix((np.concatenate(vals), (np.concatenate(rows), np.concatenate(cols))),
+                           shape=(count, count)).tocsr()
+  return { 'classes': classes, 'block': block, 'b': b, 'row': row, 'rz': rz }
+
+def coupleLayerPair(above, below):
+  """
+  coupleLayerPair(dict above, dict below)
+  Vertical coupling of two adjacent layers for Mesh3D.assembleLayers, from their assembleLayerBlock results.
+  Returns the layer-relative rows of the vertically adjacent pixel pairs and their conductances.
+  """
+  g= 1.0 / (above['rz'] + below['rz'])
+  pairs= (above['row'] >= 0) & (below['row'] >= 0)
+  return above['row'][pairs], below['row'][pairs], g[pairs]
@@ -0,0 +1,173 @@
+import os
+import time
+import argparse
+import numpy as np
+
+class MeshCache:
+  """
+  MeshCache: Content-addressed cache of meshed problems.
+
+  A meshed problem is stored in directory/<key>.npz, where the key is Mesh.runDigest,
+  the hash of the input PNG bytes, the palette, the simulation layers, and the
+  material and stackup properties. An entry holds every mesh layer that was written
+  while meshing, the node map nodeXn, nodeYn, the edge conductances gx, gy, the thermal islands,
+  and the palette pixel counts and unrecognized colors of a PNG problem, so a later mesh with identical inputs skips decoding, numbering and the conductance calculation.
+
+  The total size of the entries is capped at maxBytes. The modification time of an entry
+  is its last use, and the least recently used entries are evicted first.
+
+  Command line:
+    python MeshCache.py list <directory>
+    python MeshCache.py purge <directory> [key ...]
+  """
+
+  def __init__(self, directory, maxBytes):
+    self.directory= directory
+    self.maxBytes= maxBytes
+
+  def entryFilename(self, key):
+    return os.path.join(self.directory, key + '.npz')
+
+  def load(self, key, mesh):
+    """
+    load(MeshCache self, string key, Mesh mesh)
+    Load the cached mesh with this key into mesh. Returns False if there is no such entry.
+    """
+    fn= self.entryFilename(key)
+    if not os.path.exists(fn):
+      return False
+    os.utime(fn, None)
+    entry= np.load(fn)
+    mesh.setMeshSize(int(entry['width']), int(entry['height']))
+    for name in entry.files:
+      if name.startswith('field_'):
+        mesh.field[:, :, mesh.__dict__['_' + name[len('field_'):]]]= entry[name]
+      if name.startswith('ifield_'):
+        mesh.ifield[:, :, mesh.__dict__['_' + name[len('ifield_'):]]]= entry[name]
+    mesh.nodeCount= int(entry['nodeCount'])
+    mesh.nodeXn= entry['nodeXn']
+    mesh.nodeYn= entry['nodeYn']
+    mesh.edgeCache= (entry['gx'], entry['gy'])
+    self.loadSummary(entry, mesh)
+    print "Mesh cache hit " + key + " Width: " + str(mesh.width) + " Height: " + str(mesh.height)
+    print "Total number of independent nodes= ", mesh.nodeCount
+    return True
+
+  def store(self, key, mesh):
+    """
+    store(MeshCache self, string key, Mesh mesh)
+    Store the layers that the mesher wrote, the node map and the edge conductances.
+    The entry is written to a temporary file and renamed, so a partial entry is never loaded.
+    """
+    if not os.path.exists(self.directory):
+      os.makedirs(self.directory)
+    arrays= {}
+    for idx in range(0, len(mesh.doubleNames)):
+      if mesh.field.planes[idx] is not None:
+        arrays['field_' + mesh.doubleNames[idx]]= mesh.field.planes[idx]
+    for idx in range(0, len(mesh.intNames)):
+      if mesh.ifield.planes[idx] is not None:
+        arrays['ifield_' + mesh.intNames[idx]]= mesh.ifield.planes[idx]
+    self.storeSummary(mesh, arrays)
+    gx, gy= mesh.edgeConductances()
+    mesh.edgeCache= (gx, gy)
+    tmpFn= os.path.join(self.directory, key + '.tmp.npz')
+    np.savez(tmpFn, width=mesh.width, height=mesh.height, nodeCount=mesh.nodeCount,
+             nodeXn=mesh.nodeXn, nodeYn=mesh.nodeYn, gx=gx, gy=gy, **arrays)
+    os.rename(tmpFn, self.entryFilename(key))
+    print "Mesh cache stored " + key + " bytes= " + str(os.path.getsize(self.entryFilename(key)))
+    self.evict(key)
+
+  def storeSummary(self, mesh, arrays):
+    """
+    storeSummary(MeshCache self, Mesh mesh, dict arrays)
+    Add mesh.islands, mesh.pixelCounts and mesh.unknownColors to the arrays of an entry,
+    as plain arrays so the entry loads without pickling.
+    """
+    if hasattr(mesh, 'islands'):
+      arrays['islandLabel']= np.array([island['label'] for island in mesh.islands], dtype = 'int')
+      arrays['islandCells']= np.array([island['cells'] for island in mesh.islands], dtype = 'int')
+      arrays['islandHeat']= np.array([island['heat'] for island in mesh.islands], dtype = 'double')
+      arrays['islandBbox']= np.array([island['bbox'] for island in mesh.islands], dtype = 'int').reshape(-1, 4)
+      arrays['islandBoundary']= np.array([island['boundary'] for island in mesh.islands], dtype = 'bool')
+    if hasattr(mesh, 'pixelCounts'):
+      names= sorted(mesh.pixelCounts.keys())
+      arrays['pixelNames']= np.array(names, dtype = 'str')
+      arrays['pixelCounts']= np.array([mesh.pixelCounts[name] for name in names], dtype = 'int')
+    if hasattr(mesh, 'unknownColors'):
+      arrays['unknownRGB']= np.array([rgb for rgb, count in mesh.unknownColors], dtype = 'int').reshape(-1, 3)
+      arrays['unknownCounts']= np.array([count for rgb, count in mesh.unknownColors], dtype = 'int')
+
+  def loadSummary(self, entry, mesh):
+    if 'islandLabel' in entry.files:
+      mesh.islands= []
+      for idx in range(0, len(entry['islandLabel'])):
+        mesh.islands.append({'label': int(entry['islandLabel'][idx]), 'cells': int(entry['islandCells'][idx]),
+                             'heat': float(entry['islandHeat'][idx]),
+                             'bbox': tuple([int(v) for v in entry['islandBbox'][idx]]),
+                             'boundary': bool(entry['islandBoundary'][idx])})
+    if 'pixelNames' in entry.files:
+      mesh.pixelCounts= {}
+      for name, count in zip(entry['pixelNames'], entry['pixelCounts']):
+        mesh.pixelCounts[str(name)]= int(count)
+    if 'unknownRGB' in entry.files:
+      mesh.unknownColors= [(tuple([int(v) for v in rgb]), int(count))
+                           for rgb, count in zip(entry['unknownRGB'], entry['unknownCounts'])]
+
+  def entries(self):
+    """
+    entries(MeshCache self)
+    List of (key, bytes, last use time) for the cache entries, least recently used first.
+    """
+    entries= []
+    if not os.path.exists(self.directory):
+      return entries
+    for fn in os.listdir(self.directory):
+      if fn.endswith('.npz') and not fn.endswith('.tmp.npz'):
+        path= os.path.join(self.directory, fn)
+        entries.append((fn[:-len('.npz')], os.path.getsize(path), os.path.getmtime(path)))
+    entries.sort(key=lambda entry: entry[2])
+    return entries
+
+  def evict(self, keep):
+    entries= self.entries()
+    total= sum([entry[1] for entry in entries])
+    for key, size, mtime in entries:
+      if total <= self.maxBytes:
+        break
+      if key == keep:
+        continue
+      os.remove(self.entryFilename(key))
+      total -= size
+      print "Mesh cache evicted " + key
+
+  def list(self):
+    entries= self.entries()
+    for key, size, mtime in entries:
+      print key + " " + str(size) + " " + time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(mtime))
+    print "Mesh cache entries= " + str(len(entries)) + " bytes= " + str(sum([entry[1] for entry in entries]))
+
+  def purge(self, keys=None):
+    """
+    purge(MeshCache self, list keys)
+    Remove the entries with these keys, or all of the entries if keys is empty.
+    """
+    for key, size, mtime in self.entries():
+      if not keys or key in keys:
+        os.remove(self.entryFilename(key))
+        print "Mesh cache purged " + key
+
+def Main():
+  parser = argparse.ArgumentParser(description='List or purge the mesh cache')
+  parser.add_argument('command', choices=['list', 'purge'])
+  parser.add_argument('directory')
+  parser.add_argument('keys', nargs='*')
+  args = parser.parse_args()
+  cache= MeshCache(args.directory, 0)
+  if args.command == 'list':
+    cache.list()
+  else:
+    cache.purge(args.keys)
+
+if __name__ == '__main__':
+  Main()
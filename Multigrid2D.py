@@ -0,0 +1,137 @@
+import numpy as np
+
+import Stencil2D
+
+class Multigrid2D:
+  """
+  Multigrid2D: Geometric multigrid for the square 2D mesh.
+
+  The level hierarchy is built by Stencil2D.coarsen, which aggregates 2x2 blocks of cells
+  and forms the Galerkin coarse operator. The coarse edge conductances are sums of the
+  fine conductances, so the coarsening follows the copper and FR-4 resistances in _resis
+  instead of averaging across them, and holes stay holes.
+  Coarsening stops when a level has no more than coarseCells cells, and that level is
+  solved with a dense pseudo-inverse, which also handles thermal islands without a boundary.
+
+  The smoother is red-black Gauss-Seidel: red then black before the coarse grid correction,
+  black then red after it, so the cycle is a symmetric preconditioner for conjugate gradient.
+  cycle is "V", "W" or "F". The piecewise-constant prolongation undercorrects smooth errors,
+  so the coarse grid correction is scaled by overCorrection.
+
+  The multigrid cycle can be used standalone with solve(), or as the preconditioner for
+  Stencil2D.solvePCG with solvePCG().
+  """
+
+  def __init__(self, stencil, cycle="F", preSmooth=1, postSmooth=1, coarseCells=1024, overCorrection=1.8):
+    self.cycle= cycle
+    self.preSmooth= preSmooth
+    self.postSmooth= postSmooth
+    self.overCorrection= overCorrection
+    self.levels= [stencil]
+    while (self.levels[-1].width * self.levels[-1].height > coarseCells and
+           self.levels[-1].width > 1 and self.levels[-1].height > 1):
+      self.levels.append(self.levels[-1].coarsen())
+
+    # The red and black cells, each scaled by the inverse diagonal for the smoother.
+    self.colors= []
+    for level in self.levels:
+      x, y= np.indices((level.width, level.height))
+      red= ((x + y) % 2 == 0) & ~level.holes
+      black= ((x + y) % 2 == 1) & ~level.holes
+      self.colors.append((red / level.diag, black / level.diag))
+
+    coarsest= self.levels[-1]
+    identity= np.eye(coarsest.width * coarsest.height).reshape(coarsest.width * coarsest.height, coarsest.width, coarsest.height)
+    dense= np.array([coarsest.apply(column).ravel() for column in identity])
+    self.coarseInverse= np.linalg.pinv(dense)
+    self.iterations= 0
+    self.residual= 0.0
+
+  def report(self):
+    print "Multigrid " + self.cycle + "-cycle levels= " + str(len(self.levels)) + " grids= " + \
+      " ".join([str(level.width) + "x" + str(level.height) for level in self.levels])
+
+  def smooth(self, levelIdx, x, b, sweeps, colorOrder):
+    level= self.levels[levelIdx]
+    colors= self.colors[levelIdx]
+    r= np.empty_like(x)
+    for sweep in range(0, sweeps):
+      for color in colorOrder:
+        # The cells of one color only have neighbors of the other color,
+        # so a Jacobi update of one color is a Gauss-Seidel update.
+        level.apply(x, r)
+        np.subtract(b, r, out=r)
+        r *= colors[color]
+        x += r
+
+  def cycleLevel(self, levelIdx, b, cycle):
+    """
+    cycleLevel(Multigrid2D self, int levelIdx, ndarray b, string cycle)
+    One multigrid cycle for A x = b on level levelIdx starting from x= 0.
+    Returns the approximate solution x.
+    """
+    level= self.levels[levelIdx]
+    if levelIdx == len(self.levels) - 1:
+      return self.coarseInverse.dot(b.ravel()).reshape(level.width, level.height)
+
+    x= np.zeros((level.width, level.height), dtype = 'double')
+    self.smooth(levelIdx, x, b, self.preSmooth, (0, 1))
+    r= b - level.apply(x)
+    rc= level.restrict(r)
+    if cycle == "V":
+      ec= self.cycleLevel(levelIdx + 1, rc, "V")
+    elif cycle == "W":
+      coarse= self.levels[levelIdx + 1]
+      ec= self.cycleLevel(levelIdx + 1, rc, "W")
+      ec += self.cycleLevel(levelIdx + 1, rc - coarse.apply(ec), "W")
+    else:
+      coarse= self.levels[levelIdx + 1]
+      ec= self.cycleLevel(levelIdx + 1, rc, "F")
+      ec += self.cycleLevel(levelIdx + 1, rc - coarse.apply(ec), "V")
+    x += self.overCorrection * level.prolong(ec)
+    self.smooth(levelIdx, x, b, self.postSmooth, (1, 0))
+    return x
+
+  def precondition(self, r):
+    return self.cycleLevel(0, r, self.cycle)
+
+  def solve(self, b, x0=None, tolerance=1e-10, maxIterations=200):
+    """
+    solve(Multigrid2D self, ndarray b, ndarray x0, float tolerance, int maxIterations)
+    Standalone multigrid iteration, one cycle per iteration on the residual equation.
+    The convergence test is the same as Stencil2D.solvePCG.
+    Returns x and sets self.iterations and self.residual.
+    """
+    stencil= self.levels[0]
+    guess= stencil.boundaryGuess(b)
+    r= b - stencil.apply(guess)
+    refNorm= np.sqrt(np.vdot(r, r))
+    if refNorm == 0.0:
+      refNorm= 1.0
+    if x0 is None:
+      x= guess
+    else:
+      x= x0.copy()
+      x[stencil.holes]= 0.0
+      r= b - stencil.apply(x)
+    self.residual= np.sqrt(np.vdot(r, r)) / refNorm
+    self.iterations= 0
+    while self.residual > tolerance and self.iterations < maxIterations:
+      x += self.precondition(r)
+      r= b - stencil.apply(x)
+      self.iterations += 1
+      self.residual= np.sqrt(np.vdot(r, r)) / refNorm
+    if self.residual > tolerance:
+      print "Warning: multigrid did not converge in " + str(self.iterations) + " iterations, relative residual " + str(self.residual)
+    return x
+
+  def solvePCG(self, b, x0=None, tolerance=1e-10, maxIterations=200):
+    """
+    solvePCG(Multigrid2D self, ndarray b, ndarray x0, float tolerance, int maxIterations)
+    Conjugate gradient on the finest level with one multigrid cycle as the preconditioner.
+    """
+    stencil= self.levels[0]
+    x= stencil.solvePCG(b, x0, tolerance, maxIterations, self.precondition)
+    self.iterations= stencil.iterations
+    self.residual= stencil.residual
+    return x
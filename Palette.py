@@ -0,0 +1,81 @@
+import numpy as np
+from PIL import Image
+
+class Palette:
+  """
+  Palette: Color table that maps layer artwork PNG colors to simulation classes.
+
+  The palette is specified in the mesh configuration file:
+    "palette": {
+      "default": "fr4",
+      "colors": [
+        { "name":"heat", "color":[255, 0, 0], "matl":"Cu", "layer":"topside_cu", "heat":48e-6 },
+        { "name":"hole", "color":[255, 255, 255], "hole":1 }
+      ]
+    }
+  Each entry has a name and an RGB color. The other properties are interpreted by the mesher.
+  Pixels with colors that are not in the table get the properties of the default entry.
+
+  The image is classified with whole-array operations: each RGB triple is packed
+  into a single integer and looked up in the sorted table of packed palette colors.
+  """
+
+  def __init__(self, config):
+    self.entries= config['colors']
+    self.default= config.get('default', '')
+    self.names= [entry['name'] for entry in self.entries]
+    self.codes= np.array([self.colorCode(entry['color']) for entry in self.entries], dtype = 'int32')
+    self.maxUnknownColors= 10
+
+  def colorCode(self, rgb):
+    return (int(rgb[0]) << 16) | (int(rgb[1]) << 8) | int(rgb[2])
+
+  def colorTuple(self, code):
+    return ((code >> 16) & 255, (code >> 8) & 255, code & 255)
+
+  def defaultIndex(self):
+    if self.default in self.names:
+      return self.names.index(self.default)
+    return -1
+
+  def classify(self, fn):
+    """
+    classify(Palette self, string fn)
+    Read the PNG file fn and return an int array classes[width, height] with the palette entry
+    index for every pixel, or -1 for colors that are not in the palette.
+    Graphing package has +y up, png has it down, so the rows are flipped.
+    Also sets self.counts, the number of pixels per palette entry name, and
+    self.unknownColors, a list of (rgb, pixel count) for the most common unrecognized colors.
+    """
+    image= Image.open(fn, mode='r').convert('RGB')
+    rgb= np.asarray(image, dtype = 'int32')
+    codes= (rgb[:, :, 0] << 16) | (rgb[:, :, 1] << 8) | rgb[:, :, 2]
+    codes= codes[::-1, :].T
+
+    order= np.argsort(self.codes)
+    sortedCodes= self.codes[order]
+    pos= np.searchsorted(sortedCodes, codes)
+    pos= np.minimum(pos, len(sortedCodes) - 1)
+    found= sortedCodes[pos] == codes
+    classes= np.where(found, order[pos], -1)
+
+    counts= np.bincount(classes[found], minlength=len(self.entries))
+    self.counts= {}
+    for idx in range(0, len(self.entries)):
+      self.counts[self.names[idx]]= int(counts[idx])
+
+    unknownCodes, unknownCounts= np.unique(codes[~found], return_counts=True)
+    self.unknownPixelCount= int(unknownCounts.sum())
+    self.unknownColors= []
+    for idx in np.argsort(unknownCounts)[::-1][:self.maxUnknownColors]:
+      self.unknownColors.append((self.colorTuple(int(unknownCodes[idx])), int(unknownCounts[idx])))
+    self.unknownColorCount= len(unknownCodes)
+    return classes
+
+  def printCounts(self):
+    for idx in range(0, len(self.entries)):
+      print "Palette " + self.names[idx] + " " + str(tuple(self.entries[idx]['color'])) + " px: " + str(self.counts[self.names[idx]])
+    if self.unknownPixelCount > 0:
+      print "Unrecognized colors: " + str(self.unknownColorCount) + " px: " + str(self.unknownPixelCount) + " treated as " + str(self.default)
+      for rgb, count in self.unknownColors:
+        print "  Unrecognized color: " + str(rgb) + " px: " + str(count)
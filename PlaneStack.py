@@ -0,0 +1,77 @@
+import os
+import numpy as np
+
+class PlaneStack:
+  """
+  PlaneStack: Compact storage for the layers of the square mesh.
+
+  The mesh layers are kept as one 2D array per layer instead of a single 3D array,
+  so that each layer can have its own storage type:
+    uint8     flags such as isoflag
+    int32     node numbers and labels
+    float32   derived output temperatures
+    float64   material inputs such as resis and heat
+  A layer is only allocated when it is first used, so layers for solvers that are not
+  active take no memory.
+
+  With a directory, each layer is a memory-mapped .npy file named prefix_name.npy,
+  so the mesh can be larger than RAM and only the pages that are used are read.
+  With reopen, layer files that already exist are opened instead of created, which
+  brings back the mesh of a previous run without rebuilding it.
+
+  The accessor API is the same as the 3D array it replaces, with the layer index last:
+    stack[x, y, idx]          one cell, or any numpy index of the layer plane
+    stack[:, :, idx]          the whole layer, a view that can be written through
+    stack.plane(idx)          the whole layer as a [width, height] array
+    stack.shape               (width, height, number of layers)
+  """
+
+  def __init__(self, width, height, dtypes, directory='', names=None, prefix='', reopen=False):
+    self.width= width
+    self.height= height
+    self.dtypes= [np.dtype(dtype) for dtype in dtypes]
+    self.planes= [None] * len(dtypes)
+    self.shape= (width, height, len(dtypes))
+    self.directory= directory
+    self.names= names
+    self.prefix= prefix
+    self.reopen= reopen
+
+  def plane(self, idx):
+    if self.planes[idx] is None:
+      if self.directory == '':
+        self.planes[idx]= np.zeros((self.width, self.height), dtype = self.dtypes[idx])
+      else:
+        self.planes[idx]= self.mapPlane(idx)
+    return self.planes[idx]
+
+  def planeFilename(self, idx):
+    return os.path.join(self.directory, self.prefix + '_' + self.names[idx] + '.npy')
+
+  def mapPlane(self, idx):
+    fn= self.planeFilename(idx)
+    if self.reopen and os.path.exists(fn):
+      plane= np.load(fn, mmap_mode='r+')
+      if plane.shape == (self.width, self.height) and plane.dtype == self.dtypes[idx]:
+        return plane
+      print "Warning: Layer file " + fn + " does not match the mesh, recreating it"
+      del plane
+    return np.lib.format.open_memmap(fn, mode='w+', dtype = self.dtypes[idx], shape=(self.width, self.height))
+
+  def flush(self):
+    for plane in self.planes:
+      if isinstance(plane, np.memmap):
+        plane.flush()
+
+  def __getitem__(self, key):
+    return self.plane(key[2])[key[0], key[1]]
+
+  def __setitem__(self, key, value):
+    self.plane(key[2])[key[0], key[1]]= value
+
+  def nbytes(self):
+    """
+    nbytes(PlaneStack self)
+    Bytes in the allocated layers, for memory-mapped layers this is the size of the files.
+    """
+    return sum([plane.nbytes for plane in self.planes if plane is not None])
@@ -0,0 +1,240 @@
+import numpy as np
+import scipy.sparse as sparse
+import scipy.ndimage as ndimage
+
+class Quadtree2D:
+  """
+  Quadtree2D: Adaptive coarsening of the square 2D mesh.
+
+  Most of a board image is large uniform areas of FR-4 or plane copper, where one node per pixel
+  is wasted. The quadtree merges such areas into square cells of 2**k x 2**k pixels, aligned to
+  multiples of their size, up to level maxLevel. A block of pixels can be a cell if all of its pixels
+  have the same resistance per square and none of them is a hole, a heat source or a boundary condition,
+  so the heat sources and boundary conditions keep their pixel resolution.
+  With balance, the cells that share a face differ by at most one level, so the size of the cells
+  grades smoothly away from the detail.
+
+  self.cell[x, y] is the matrix row of the cell that contains pixel x, y, or -1 for a hole.
+  self.cellX, self.cellY are the first pixel of each cell and self.cellSize is its size in pixels.
+
+  The conductance across a face between cells a and b is the sum over the pixel pairs on the face of
+    1/(R_a s_a/2 + R_b s_b/2)
+  where R is the resistance per square and s is the cell size in pixels: each pixel pair is a strip one
+  pixel wide from the center of one cell to the center of the other. With single-pixel cells this is
+  the 2/(R1+R2) of the 2D mesh, and between two cells of the same size s it is s strips of 1/(R s),
+  which is 1/R, the conductance of one square.
+  This is not exact on the hanging faces, where a cell meets two smaller cells: the strips ignore the
+  offset along the face between the cell centers, so the total current across the face is right but
+  it is split evenly between the small cells whatever the gradient along the face.
+  faceCorrection() corrects the split with the cell gradients, as a RHS that the solver iterates with
+  the same factor, and gradingRadius keeps pixel resolution within that many pixels of the heat sources
+  and boundary conditions.
+  Against the pixel solve of Layout1.png (187.3 C rise) with maxLevel 5, the largest pixel error is
+    7.3 C (3.9%) uncorrected, 4.3 C (2.3%) corrected, and 3.1 C (1.7%) corrected with gradingRadius 4,
+  with 12117, 12117 and 16350 cells for 150000 pixels. The error of the hottest pixel is 3.6, 1.1 and 0.8 C.
+
+  unload() maps a solution back onto the pixel grid for plotting, with a linear reconstruction
+  inside each cell from the slopes to its neighbors.
+  """
+
+  def __init__(self, mesh, maxLevel=5, balance=True, gradingRadius=4):
+    self.width= mesh.width
+    self.height= mesh.height
+    self.maxLevel= maxLevel
+    self.holes= mesh.ifield[:, :, mesh._holeflag] < 0
+    self.resis= mesh.field[:, :, mesh._resis]
+    self.heat= mesh.field[:, :, mesh._heat]
+    isoflag= mesh.ifield[:, :, mesh._isoflag] == 1
+    self.boundCond= np.where(isoflag & ~self.holes, mesh.field[:, :, mesh._boundCond], 0.0)
+    self.isodeg= mesh.field[:, :, mesh._isodeg]
+    self.pixelCount= mesh.nodeCount
+
+    detail= (self.heat != 0.0) | isoflag
+    if gradingRadius > 0:
+      detail= ndimage.maximum_filter(detail, size=2*gradingRadius + 1, mode='constant')
+    mergeable= ~self.holes & ~detail
+    self.level= self.uniformLevels(mergeable)
+    if balance:
+      self.balanceLevels()
+    self.numberCells()
+
+  def blocks(self, plane, size, fill):
+    """
+    blocks(Quadtree2D self, ndarray plane, int size, fill)
+    The plane as an array [blockWidth, size, blockHeight, size] of aligned size x size blocks,
+    padded with fill to a whole number of blocks.
+    """
+    blockWidth= (self.width + size - 1) // size
+    blockHeight= (self.height + size - 1) // size
+    padded= np.empty((blockWidth * size, blockHeight * size), dtype = plane.dtype)
+    padded.fill(fill)
+    padded[:self.width, :self.height]= plane
+    return padded.reshape(blockWidth, size, blockHeight, size)
+
+  def expand(self, blocks, size):
+    return blocks.repeat(size, 0).repeat(size, 1)[:self.width, :self.height]
+
+  def uniformLevels(self, mergeable):
+    """
+    uniformLevels(Quadtree2D self, ndarray mergeable)
+    For each pixel, the largest level k such that the aligned block of 2**k pixels that contains it
+    is all mergeable pixels with the same resistance. Blocks that extend past the edge of the mesh
+    are not uniform. A uniform block is made of uniform blocks, so the levels nest.
+    """
+    level= np.zeros((self.width, self.height), dtype = 'int8')
+    resis= np.where(mergeable, self.resis, np.nan)
+    for k in range(1, self.maxLevel + 1):
+      size= 2**k
+      blockResis= self.blocks(resis, size, np.nan)
+      blockMin= blockResis.min(3).min(1)
+      uniform= self.blocks(mergeable, size, False).all(3).all(1) & (blockMin == blockResis.max(3).max(1))
+      if not uniform.any():
+        break
+      level += self.expand(uniform, size)
+    return level
+
+  def balanceLevels(self):
+    """
+    balanceLevels(Quadtree2D self)
+    Lower the levels until the cells on either side of each face differ by at most one level.
+    A pixel is lowered to one more than its lowest neighbor, then each cell that lost a pixel
+    is split, which can lower more pixels, until nothing changes. Holes do not limit their neighbors.
+    """
+    cross= ndimage.generate_binary_structure(2, 1)
+    while True:
+      neighbor= ndimage.minimum_filter(np.where(self.holes, self.maxLevel, self.level), footprint=cross, mode='nearest')
+      level= np.minimum(self.level, neighbor + 1).astype('int8')
+      for k in range(self.maxLevel, 0, -1):
+        size= 2**k
+        split= self.expand(self.blocks(level, size, 0).min(3).min(1) < k, size)
+        level[split & (level >= k)]= k - 1
+      if (level == self.level).all():
+        break
+      self.level= level
+
+  def numberCells(self):
+    """
+    numberCells(Quadtree2D self)
+    Number the cells x-major by their first pixel, and map every pixel to the row of its cell.
+    """
+    size= np.left_shift(1, self.level.astype('int32'))
+    x, y= np.indices((self.width, self.height))
+    first= (x % size == 0) & (y % size == 0) & ~self.holes
+    self.cellX, self.cellY= np.nonzero(first)
+    self.cellSize= size[self.cellX, self.cellY]
+    self.nodeCount= len(self.cellX)
+    firstRow= np.empty((self.width, self.height), dtype = 'int32')
+    firstRow.fill(-1)
+    firstRow[self.cellX, self.cellY]= np.arange(self.nodeCount, dtype = 'int32')
+    self.cell= firstRow[x - x % size, y - y % size]
+    self.cell[self.holes]= -1
+
+  def report(self):
+    print "Quadtree cells= " + str(self.nodeCount) + " pixels= " + str(self.pixelCount) + \
+      " reduction= " + str(round(float(self.pixelCount) / max(self.nodeCount, 1), 1)) + \
+      " cells per level= " + str(np.bincount(self.level[self.cellX, self.cellY], minlength=self.maxLevel + 1).tolist())
+
+  def edgeConductances(self):
+    """
+    edgeConductances(Quadtree2D self)
+    Pixel pair conductances 1/(R_a s_a/2 + R_b s_b/2) as gx[w-1, h] and gy[w, h-1] like Mesh.edgeConductances,
+    zero for pairs inside one cell and pairs with a hole.
+    """
+    with np.errstate(divide='ignore', invalid='ignore'):
+      half= np.where(self.holes, np.inf, self.resis * np.left_shift(1, self.level.astype('int32')) / 2.0)
+      gx= 1.0 / (half[:-1, :] + half[1:, :])
+      gy= 1.0 / (half[:, :-1] + half[:, 1:])
+    gx[self.cell[:-1, :] == self.cell[1:, :]]= 0.0
+    gy[self.cell[:, :-1] == self.cell[:, 1:]]= 0.0
+    return gx, gy
+
+  def assembleSparseMatrix(self, damping=0.0):
+    """
+    assembleSparseMatrix(Quadtree2D self, float damping)
+    The conductance matrix A and the RHS b of the cells, in the form of Solver2D.assembleSparseMatrix.
+    The pixel pairs between two cells are summed into one entry. Heat sources and boundary conditions
+    are always single-pixel cells, so their terms are the same as in the pixel mesh.
+    """
+    gx, gy= self.edgeConductances()
+    diag= self.boundCond.copy()
+    diag[:-1, :] += gx
+    diag[1:, :]  += gx
+    diag[:, :-1] += gy
+    diag[:, 1:]  += gy
+
+    solved= ~self.holes
+    cell= self.cell[solved]
+    b= np.bincount(cell, weights=self.heat[solved] + self.boundCond[solved] * self.isodeg[solved], minlength=self.nodeCount)
+    diagIdx= np.arange(self.nodeCount)
+    rows= [diagIdx]
+    cols= [diagIdx]
+    vals= [np.bincount(cell, weights=diag[solved], minlength=self.nodeCount) + damping]
+    for lo, hi, g in [(self.cell[:-1, :], self.cell[1:, :], gx), (self.cell[:, :-1], self.cell[:, 1:], gy)]:
+      pairs= (lo >= 0) & (hi >= 0) & (lo != hi)
+      rows += [lo[pairs], hi[pairs]]
+      cols += [hi[pairs], lo[pairs]]
+      vals += [-g[pairs], -g[pairs]]
+    A= sparse.coo_matrix((np.concatenate(vals), (np.concatenate(rows), np.concatenate(cols))),
+                         shape=(self.nodeCount, self.nodeCount)).tocsr()
+    return A, b
+
+  def gradients(self, x):
+    """
+    gradients(Quadtree2D self, ndarray x)
+    The gradient of each cell along x and y, the mean of the slopes (x_b - x_a)/((s_a + s_b)/2)
+    across the pixel pairs on its faces, or zero for a cell without neighbors along that axis.
+    """
+    size= np.where(self.holes, 0, np.left_shift(1, self.level.astype('int32'))).astype('double')
+    gradient= []
+    for lo, hi in [(np.s_[:-1, :], np.s_[1:, :]), (np.s_[:, :-1], np.s_[:, 1:])]:
+      pairs= (self.cell[lo] >= 0) & (self.cell[hi] >= 0) & (self.cell[lo] != self.cell[hi])
+      a= self.cell[lo][pairs]
+      b= self.cell[hi][pairs]
+      slope= (x[b] - x[a]) / ((size[lo][pairs] + size[hi][pairs]) / 2.0)
+      count= np.bincount(np.concatenate([a, b]), minlength=self.nodeCount)
+      total= np.bincount(np.concatenate([a, b]), weights=np.concatenate([slope, slope]), minlength=self.nodeCount)
+      gradient.append(total / np.maximum(count, 1))
+    return gradient
+
+  def faceCorrection(self, x):
+    """
+    faceCorrection(Quadtree2D self, ndarray x)
+    The RHS correction for the hanging faces, where a cell meets two smaller cells.
+    The strip of each pixel pair runs straight across the face, but the temperatures of the matrix
+    are at the cell centers, which are offset along the face from the strip. The correction moves each
+    end of the strip to the face pixel with the gradient of its cell along the face, and returns the
+    difference of the pair currents g (x_b + t_b o_b - x_a - t_a o_a) - g (x_b - x_a) as the current into
+    a and out of b, so it conserves heat. Between cells of the same size the offsets of a face cancel.
+    """
+    gx, gy= self.edgeConductances()
+    gradient= self.gradients(x)
+    pos= np.indices((self.width, self.height)).astype('double')
+    r= np.zeros(self.nodeCount, dtype = 'double')
+    for axis, lo, hi, g in [(1, np.s_[:-1, :], np.s_[1:, :], gx), (0, np.s_[:, :-1], np.s_[:, 1:], gy)]:
+      pairs= (self.cell[lo] >= 0) & (self.cell[hi] >= 0) & (self.cell[lo] != self.cell[hi])
+      a= self.cell[lo][pairs]
+      b= self.cell[hi][pairs]
+      center= np.array([self.cellX, self.cellY][axis]) + (self.cellSize - 1) / 2.0
+      along= pos[axis][lo][pairs]
+      current= g[pairs] * (gradient[axis][b] * (along - center[b]) - gradient[axis][a] * (along - center[a]))
+      r += np.bincount(a, weights=current, minlength=self.nodeCount)
+      r -= np.bincount(b, weights=current, minlength=self.nodeCount)
+    return r
+
+  def unload(self, x):
+    """
+    unload(Quadtree2D self, ndarray x)
+    The cell solution x on the pixel grid [width, height], zero in the holes.
+    Inside a cell larger than one pixel the temperature is the cell temperature plus its gradient
+    from gradients() times the offset from the center of the cell. The offsets sum to zero,
+    so the mean over each cell is still x, and single-pixel cells are unchanged.
+    """
+    pos= np.indices((self.width, self.height)).astype('double')
+    grid= np.zeros((self.width, self.height), dtype = 'double')
+    solved= ~self.holes
+    cell= self.cell[solved]
+    grid[solved]= x[cell]
+    for axis, gradient in enumerate(self.gradients(x)):
+      center= np.array([self.cellX, self.cellY][axis]) + (self.cellSize - 1) / 2.0
+      grid[solved] += gradient[cell] * (pos[axis][solved] - center[cell])
+    return grid
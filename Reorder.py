@@ -0,0 +1,81 @@
+import numpy as np
+import scipy.sparse.csgraph as csgraph
+
+class Reorder:
+  """
+  Reorder: Fill-reducing node orderings for direct factorization.
+
+  The mesh numbers the nodes x-major, which makes a banded matrix with a bandwidth of
+  the board height. A Cholesky-like factorization fills in the whole band, so the factor
+  has about nodeCount * height nonzeros and the fill grows with the board size.
+
+  method is one of:
+    "none"                no reordering, the x-major mesh numbering
+    "nestedDissection"    geometric nested dissection of the grid using the node x, y locations
+    "rcm"                 reverse Cuthill-McKee from scipy.sparse.csgraph
+  Nested dissection recursively splits the grid in half along its longer side with a
+  one-cell-wide separator, numbering both halves before the separator. On an n x n grid the
+  factor has O(n**2 log n) nonzeros instead of O(n**3) for the band. Reverse Cuthill-McKee is
+  cheap to compute, but only reduces the bandwidth.
+
+  The permutation perm lists the mesh node numbers in their new order, so row k of the
+  reordered matrix is row perm[k] of the original.
+  """
+
+  def __init__(self, method, nodeXn, nodeYn, leafSize=8):
+    self.method= method
+    self.nodeXn= nodeXn
+    self.nodeYn= nodeYn
+    self.leafSize= leafSize
+    self.perm= None
+    self.defaultNonzeros= None
+
+  def permutation(self, A):
+    """
+    permutation(Reorder self, scipy.sparse matrix A)
+    The fill-reducing permutation for the matrix A, which is computed once and reused,
+    since all the matrices of a mesh have the same pattern.
+    """
+    if self.perm is None:
+      if self.method == "nestedDissection":
+        self.perm= self.nestedDissection(self.nodeXn, self.nodeYn)
+      elif self.method == "rcm":
+        self.perm= csgraph.reverse_cuthill_mckee(A.tocsr(), symmetric_mode=True).astype('int64')
+      else:
+        self.perm= np.arange(A.shape[0])
+    return self.perm
+
+  def nestedDissection(self, xn, yn):
+    """
+    nestedDissection(Reorder self, ndarray xn, ndarray yn)
+    Geometric nested dissection of the nodes at locations xn, yn.
+    Holes need no special handling, a separator line through a hole just has fewer nodes.
+    """
+    parts= []
+    self.dissect(np.arange(len(xn)), xn, yn, parts)
+    return np.concatenate(parts)
+
+  def dissect(self, nodes, xn, yn, parts):
+    if len(nodes) <= self.leafSize:
+      parts.append(nodes)
+      return
+    x= xn[nodes]
+    y= yn[nodes]
+    if x.max() - x.min() >= y.max() - y.min():
+      coord= x
+    else:
+      coord= y
+    middle= (coord.min() + coord.max()) // 2
+    self.dissect(nodes[coord < middle], xn, yn, parts)
+    self.dissect(nodes[coord > middle], xn, yn, parts)
+    parts.append(nodes[coord == middle])
+
+  def report(self, factor):
+    """
+    report(Reorder self, factor)
+    Compare the reordered factor with the factor of the default SciPy backend, which orders the
+    columns with MMD_AT_PLUS_A. SciSolver factors the default ordering once per mesh to fill in
+    self.defaultNonzeros, like the permutation all the matrices of a mesh share it.
+    """
+    print "Reorder " + self.method + ": default MMD_AT_PLUS_A factor L+U nonzeros= " + str(self.defaultNonzeros) + \
+      " reordered factor L+U nonzeros= " + str(factor.L.nnz + factor.U.nnz)
@@ -0,0 +1,107 @@
+import numpy as np
+import scipy.io
+import scipy.sparse.linalg as linalg
+
+class SciSolver:
+  def __init__(self, nodeCount, debug):
+
+    """
+    Sparse direct solver that does not need PyTrilinos.
+    The matrix is held as a scipy.sparse matrix, so memory is proportional
+    to the number of nonzeros instead of NumGlobalElements squared.
+    """
+
+    self.debug= debug
+
+    self.NumGlobalElements = nodeCount
+    self.A                 = None
+    self.b                 = np.zeros(self.NumGlobalElements, dtype = 'double')
+    self.x                 = np.zeros(self.NumGlobalElements, dtype = 'double')
+    self.mmPrefix          = "sp"
+    self.mmExtension       = "mtx"
+    self.probFilename      = self.mmPrefix + "A." + self.mmExtension
+    self.rhsFilename       = self.mmPrefix + "RHS." + self.mmExtension
+    self.xFilename         = self.mmPrefix + "x." + self.mmExtension
+    self.reorder           = None
+
+  def loadMatrixCSR(self, A, b):
+    """
+    loadMatrixCSR(SciSolver self, scipy.sparse.csr_matrix A, ndarray b)
+    SuperLU works on compressed columns, since A is symmetric this is just a format change.
+    """
+    self.A= A.tocsc()
+    self.loadRHS(b)
+
+  def loadRHS(self, b):
+    self.b= np.array(b, dtype = 'double')
+
+  def factorMatrix(self, A=None):
+    """
+    factorMatrix(SciSolver self, scipy.sparse matrix A)
+    Factors self.A, or A if it is given.
+    The conductance matrix is symmetric positive definite, so the factorization
+    uses a symmetric fill-reducing ordering and no partial pivoting,
+    which makes the LU factorization behave like a Cholesky factorization.
+    The factorization only depends on A, so it can be reused for any RHS.
+    If self.reorder is a Reorder, its permutation is applied symmetrically to A
+    and replaces the SuperLU column ordering.
+    """
+    if A is None:
+      A= self.A
+    if self.reorder is not None:
+      perm= self.reorder.permutation(A)
+      factor= linalg.splu(A.tocsr()[perm][:, perm].tocsc(), permc_spec='NATURAL', diag_pivot_thresh=0.0,
+                          options=dict(SymmetricMode=True))
+      factor= PermutedFactor(factor, perm)
+      if self.reorder.defaultNonzeros is None:
+        default= self.defaultFactor(A)
+        self.reorder.defaultNonzeros= default.L.nnz + default.U.nnz
+      self.reorder.report(factor)
+    else:
+      factor= self.defaultFactor(A)
+    if self.debug:
+      print "Factor nonzeros L+U: " + str(factor.L.nnz + factor.U.nnz)
+    return factor
+
+  def defaultFactor(self, A):
+    """
+    defaultFactor(SciSolver self, scipy.sparse matrix A)
+    Factorization of A with the SuperLU MMD_AT_PLUS_A column ordering, used without a Reorder.
+    """
+    return linalg.splu(A.tocsc(), permc_spec='MMD_AT_PLUS_A', diag_pivot_thresh=0.0,
+                       options=dict(SymmetricMode=True))
+
+  def solveMatrixSuperLU(self, factor=None):
+    """
+    solveMatrixSuperLU(SciSolver self)
+    # self.x are the unknowns to be solved.
+    # self.A is the sparse matrix describing the thermal matrix
+    # self.b has the sources for heat and boundary conditions
+    # factor is a factorization of A from factorMatrix, or None to factor A here.
+    """
+    if factor is None:
+      factor= self.factorMatrix()
+    self.factor= factor
+    self.x= self.factor.solve(self.b)
+
+  def saveMatrix(self):
+    scipy.io.mmwrite(self.probFilename, self.A)
+    scipy.io.mmwrite(self.rhsFilename, self.b.reshape(-1, 1))
+    scipy.io.mmwrite(self.xFilename, self.x.reshape(-1, 1))
+
+class PermutedFactor:
+  """
+  Factorization of the symmetrically permuted matrix A[perm][:, perm], solved in the original node order.
+  """
+
+  def __init__(self, factor, perm):
+    self.factor= factor
+    self.perm= perm
+    self.L= factor.L
+    self.U= factor.U
+    self.shape= factor.shape
+
+  def solve(self, b):
+    x= np.empty_like(b)
+    x[self.perm]= self.factor.solve(b[self.perm])
+    return x
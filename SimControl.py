@@ -6,6 +6,7 @@ import Matls
 import Vias
 import Mesh2D
 import Solver2D
+import FactorCache
 import InteractivePlot
 import Http
 import Html
@@ -66,6 +67,9 @@ class SimControl:
     print "Config file is: " + str(args.cfg)   
     self.configJSON= args.cfg.read()
     self.config= yaml.load(self.configJSON)  
+    # Kept across solveModel calls so that re-solving the same geometry with new heat sources
+    # reuses the matrix factorization.
+    self.factorCache= FactorCache.FactorCache(self.config['solver'].get('factorCacheSize', 4))
   
   def loadModel(self):
     self.matls = Matls.Matls(self.config['matl_config'])
@@ -100,8 +104,13 @@ class SimControl:
     self.html= h.html(h.head(head) + h.body(body))   
   
   def solveModel(self):
-    self.solv = Solver2D.Solver2D(self.config['solver'], self.mesh.nodeCount)
+    self.solv = Solver2D.Solver2D(self.config['solver'], self.mesh.nodeCount, self.factorCache)
     self.solv.solve(self.lyr, self.mesh, self.matls)    
+    self.mesh.flush()
+    if 'scenarios' in self.config['solver']:
+      # Power-scenario sweep: one PNG heat layer per scenario, all solved with one factorization.
+      self.scenarioTemperature, self.scenarioBalance= \
+        self.solv.solveScenarios(self.lyr, self.mesh, self.matls, self.config['solver']['scenarios'])
     return
     
   def loadView(self):
@@ -1,8 +1,20 @@
+import os
+import time
+import resource
 import numpy as np
+import scipy.sparse as sparse
+import scipy.ndimage as ndimage
+import scipy.sparse.linalg as linalg
 from collections import Counter
 
 import TriSolver
 import SpSolver
+import SciSolver
+import Reorder
+import Stencil2D
+import Multigrid2D
+import Quadtree2D
+import FactorCache
 import MatrixDiagnostic
 import MatrixMarket as mm
 import MMHtml
@@ -45,6 +57,37 @@ import MMHtml
 #
 
 
+def sequentialSum(start, values):
+  """
+  sequentialSum(float start, ndarray values)
+  start + values[0] + values[1] + ... added one at a time in double precision.
+  This is the same sum as a Python loop, while values.sum() adds pairwise and can differ in the last bits.
+  """
+  return np.cumsum(np.concatenate(([start], np.asarray(values, dtype = 'double'))))[-1]
+
+
+def peakRSS():
+  """
+  Peak resident set size of this process in bytes, ru_maxrss is in kilobytes on Linux.
+  """
+  return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024.0
+
+def arrayBytes(values):
+  """
+  Bytes in the numpy arrays and scipy.sparse matrices in values, and in the lists and tuples in values.
+  Anything else is not counted.
+  """
+  total= 0
+  for value in values:
+    if isinstance(value, np.ndarray):
+      total += value.nbytes
+    elif sparse.issparse(value):
+      total += arrayBytes([value.data, getattr(value, 'indices', None), getattr(value, 'indptr', None)])
+    elif isinstance(value, (list, tuple)):
+      total += arrayBytes(value)
+  return total
+
+
 class Solver2D:
   """
   The Solver class loads a matrix and solves it.
@@ -62,10 +105,16 @@ class Solver2D:
 
   """
 
-  def __init__(self, config, nodeCount):
+  def __init__(self, config, nodeCount, factorCache=None):
     
     self.NumGlobalElements = nodeCount
     
+    # Factorizations are kept between solves of the same geometry, so the cache
+    # is normally owned by the caller and outlives this Solver2D.
+    if factorCache is None:
+      factorCache= FactorCache.FactorCache(config.get('factorCacheSize', 4))
+    self.factorCache       = factorCache
+    
     self.deck              = ''
     self.GDamping          = 0
     # self.GDamping          = 1e-12  # Various values such as 1e-12, 1e-10, and -1e-10 have worked or not!
@@ -90,12 +139,19 @@ class Solver2D:
     self.useEigen          = False 
     self.useTrilinos       = False
     self.useNumpy          = False
+    self.useSciPy          = False
+    self.useTransient      = False
+    self.useStencil        = False
+    self.useMultigrid      = False
+    self.useQuadtree       = False
+    self.useNested         = False
+    self.autoConfig        = None
     foundSolver= 0
     for solver in config['solvers']:
       if solver['active'] == 1:
         if (solver['solverName'] == "Eigen"):
           self.useEigen = True
-          self.useTrilinos = True
+          self.eigenConfig= solver
         if (solver['solverName'] == "Aztec"):
           self.useAztec = True
           self.useTrilinos = True
@@ -104,6 +160,27 @@ class Solver2D:
           self.useTrilinos = True
         if (solver['solverName'] == "Numpy"):
           self.useNumpy = True        
+        if (solver['solverName'] == "SciPy"):
+          self.useSciPy = True
+        if (solver['solverName'] == "Transient"):
+          self.useTransient = True
+          self.transientConfig= solver
+        if (solver['solverName'] == "Stencil"):
+          self.useStencil = True
+          self.stencilConfig= solver
+        if (solver['solverName'] == "Multigrid"):
+          self.useMultigrid = True
+          self.multigridConfig= solver
+        if (solver['solverName'] == "Quadtree"):
+          self.useQuadtree = True
+          self.quadtreeConfig= solver
+        if (solver['solverName'] == "Nested"):
+          self.useNested = True
+          self.nestedConfig= solver
+          if solver.get('refine', 'pcg') == 'aztec':
+            self.useTrilinos = True
+        if (solver['solverName'] == "Auto"):
+          self.autoConfig= solver
         if (solver['solverName'] == "Spice"):
           self.useSpice = True
           self.spice= SpSolver.SpSolver(solver['simbasename'])
@@ -111,12 +188,35 @@ class Solver2D:
     if (self.useSpice == False):
       self.spice= None       
   
+    # Fill-reducing reordering for the SciPy factorizations: "none", "nestedDissection" or "rcm"
+    self.reorder= "none"
+    # Boundary cells as Norton conductances to isodeg, "norton", or eliminated at isodeg, "dirichlet".
+    self.boundaryMode= "norton"
+    # Symmetric diagonal equilibration D A D of the matrix backends, 0 or 1.
+    self.equilibrate= 0
     for solver in config['solverFlags']:
       self.__dict__[solver['flag']] = solver['setting']
       
+    # Memory ceiling for the matrix and the solver, checked before anything large is allocated.
+    self.memoryLimit= config.get('memoryLimitMB', 4096) * 1024.0 * 1024.0
+    self.autoBackend= None
+    self.startRSS= peakRSS()
+    self.autoSeconds= 0.0
+    if self.autoConfig is not None:
+      self.clearBackends()
+      name= self.selectBackend(nodeCount)
+      if name is not None:
+        self.activateBackend(name, nodeCount)
+    if self.useNumpy == True:
+      self.guardDense(nodeCount)
+    self.checkBoundaryMode()
+      
     if self.useTrilinos == True:
       mostCommonNonzeroEntriesPerRow = 5
       self.solver= TriSolver.TriSolver(nodeCount, mostCommonNonzeroEntriesPerRow, self.debug)
+      
+    if (self.useSciPy == True or self.useTransient == True):
+      self.sciSolver= SciSolver.SciSolver(nodeCount, self.debug)
 
     self.totalBoundaryCurrent = 0.0
     self.totalInjectedCurrent = 0.0
@@ -145,54 +245,363 @@ class Solver2D:
       self.loadSpiceHeatSources(lyr, mesh, self.spice)      
       self.solveSpice(mesh, lyr)
       
+    # The matrix is assembled on first use, a cached factorization only needs the RHS.
+    self.Asp= None
+    self.bsp= self.assembleRHS(mesh)
+    self.setupEquilibration(mesh)
+    if (self.useSciPy == True or self.useTransient == True):
+      self.setupReorder(mesh)
+    
     if (self.useAztec == True):
-      self.loadMatrix(lyr, mesh, matls, self.solver.A, self.solver.b)
+      self.solver.loadMatrixCSR(self.systemMatrix(lyr, mesh, matls), self.systemRHS())
       self.solveAztecOO(mesh, lyr)
-      if (self.useEigen == True):
-        print "Solving for eigenvalues"
-        self.solveEigen()
-        print "Finished solving for eigenvalues"      
       
     if (self.useAmesos == True):
-      self.loadMatrix(lyr, mesh, matls, self.solver.A, self.solver.b)
-      self.solveAmesos(mesh, lyr)  
-      if (self.useEigen == True):
-        print "Solving for eigenvalues"
-        self.solveEigen()
-        print "Finished solving for eigenvalues"      
+      key, factor= self.cachedFactor("Amesos", mesh)
+      if (factor is None or self.matrixMarket == True):
+        self.solver.loadMatrixCSR(self.systemMatrix(lyr, mesh, matls), self.systemRHS())
+      else:
+        self.solver.loadRHS(self.systemRHS())
+      if factor is None:
+        factor= self.solver.factorMatrixAmesos()
+        self.factorCache.put(key, factor)
+      self.solveAmesos(mesh, lyr, factor)
       
     if (self.useNumpy == True):
-      self.loadMatrix(lyr, mesh, matls, self.As, self.bs)
+      start= time.time()
+      self.As.fill(0.0)
+      self.systemMatrix(lyr, mesh, matls).toarray(out=self.As)
+      self.bs[:]= self.systemRHS()
       self.solveNumpy(mesh, lyr)
+      self.backendTime("Numpy", start)
+      
+    start= time.time()
+    if (self.useSciPy == True and self.boundaryMode == "dirichlet"):
+      self.solveSciPyDirichlet(lyr, mesh, matls)
+    elif (self.useSciPy == True):
+      key, factor= self.cachedFactor("SciPy", mesh)
+      if (factor is None or self.matrixMarket == True):
+        self.sciSolver.loadMatrixCSR(self.systemMatrix(lyr, mesh, matls), self.systemRHS())
+      else:
+        self.sciSolver.loadRHS(self.systemRHS())
+      if factor is None:
+        factor= self.sciSolver.factorMatrix()
+        self.factorCache.put(key, factor)
+      self.sciFactor= factor
+      self.solveSciPy(mesh, lyr, factor)
+    self.backendTime("SciPy", start)
+      
+    if (self.useEigen == True):
+      print "Solving for eigenvalues"
+      self.solveEigen(lyr, mesh, matls)
+      print "Finished solving for eigenvalues"      
+      
+    if (self.useStencil == True):
+      self.solveStencil(mesh, lyr)
+      
+    if (self.useMultigrid == True):
+      start= time.time()
+      self.solveMultigrid(mesh, lyr)
+      self.backendTime("Multigrid", start)
+      
+    if (self.useQuadtree == True):
+      self.solveQuadtree(mesh, lyr)
+      
+    if (self.useNested == True):
+      self.solveNested(lyr, mesh, matls)
+      
+    if (self.useTransient == True):
+      self.solveTransient(lyr, mesh, matls)
       
     if (self.matrixMarket == True):
-      self.solver.saveMatrix()
+      if (self.useTrilinos == True):
+        self.solver.saveMatrix()
+      if (self.useSciPy == True):
+        self.sciSolver.saveMatrix()
     # if (self.debug == True):
       # self.printNumpy()
       
+    if (self.autoBackend is not None):
+      self.reportBackend(self.autoSeconds)
+      
     if (self.webPage == True):
       self.createWebPage(lyr, mesh)
       
     
       
+  def estimateBackends(self, nodeCount):
+    """
+    estimateBackends(Solver self, int nodeCount)
+    Predicted memory in bytes and time in seconds of each backend for a mesh of nodeCount nodes,
+    as a dictionary of backend name to (bytes, seconds). The 5-point stencil has about 5 nonzeros per row.
+      Numpy      the dense matrix and the copy that LAPACK factors, 2/3 N^3 flops.
+      SciPy      SuperLU fill of about 4 N log2(N) nonzeros at 16 bytes each with the index
+                 and the matrix copies, and a time that grows like N^1.5 for a 2D mesh.
+      Multigrid  about 256 bytes per node for the levels and the PCG vectors, about 30 iterations.
+    The constants were measured on the example layouts with one core, the time scales can be
+    changed with denseFlopRate, sparseTimeScale and iterativeTimeScale in the Auto solver entry.
+    """
+    cfg= self.autoConfig or {}
+    n= float(max(nodeCount, 2))
+    fill= 4.0 * n * np.log2(n)
+    estimates= {}
+    estimates['Numpy']= (16.0 * n * n, (2.0 / 3.0) * n**3 / float(cfg.get('denseFlopRate', 1.0e10)))
+    estimates['SciPy']= (16.0 * fill + 24.0 * 5.0 * n, float(cfg.get('sparseTimeScale', 1.5e-8)) * n**1.5)
+    estimates['Multigrid']= (256.0 * n, float(cfg.get('iterativeTimeScale', 3.0e-7)) * 30.0 * n)
+    return estimates
+
+  def clearBackends(self):
+    """
+    clearBackends(Solver self)
+    Turn off every hand-chosen solver, so that the Auto choice replaces them.
+    """
+    for name in ['Spice', 'Aztec', 'Amesos', 'Eigen', 'Trilinos', 'Numpy', 'SciPy', 'Transient',
+                 'Stencil', 'Multigrid', 'Quadtree', 'Nested']:
+      self.__dict__['use' + name]= False
+    self.spice= None
+
+  def selectBackend(self, nodeCount, candidates=['Numpy', 'SciPy', 'Multigrid']):
+    """
+    selectBackend(Solver self, int nodeCount, list candidates)
+    The fastest predicted backend of candidates that fits in the memory ceiling,
+    or None if none fits.
+    """
+    estimates= self.estimateBackends(nodeCount)
+    fits= [(estimates[name][1], name) for name in candidates if estimates[name][0] <= self.memoryLimit]
+    for name in sorted(estimates.keys()):
+      print "Auto estimate " + name + " memory= " + str(round(estimates[name][0] / 1048576.0, 1)) + "MB time= " + \
+        str(round(estimates[name][1], 3)) + "s"
+    if len(fits) == 0:
+      print "Error: No solver fits " + str(nodeCount) + " nodes in the memory limit of " + \
+        str(round(self.memoryLimit / 1048576.0)) + "MB, not solving"
+      return None
+    return min(fits)[1]
+
+  def activateBackend(self, name, nodeCount):
+    self.__dict__['use' + name]= True
+    if self.useMultigrid and not hasattr(self, 'multigridConfig'):
+      self.multigridConfig= {}
+    self.autoBackend= name
+    self.autoEstimate= self.estimateBackends(nodeCount)[name]
+    print "Auto solver backend= " + name + " for " + str(nodeCount) + " nodes"
+
+  def guardDense(self, nodeCount):
+    """
+    guardDense(Solver self, int nodeCount)
+    The Numpy solver allocates a dense N x N matrix. If that does not fit in the memory ceiling,
+    it is turned off before allocating, and if no other matrix backend is on, the sparse backend
+    that Auto would pick takes its place.
+    """
+    estimates= self.estimateBackends(nodeCount)
+    if estimates['Numpy'][0] <= self.memoryLimit:
+      return
+    print "Warning: The dense Numpy solver needs " + str(round(estimates['Numpy'][0] / 1048576.0)) + \
+      "MB for " + str(nodeCount) + " nodes, over the memory limit of " + str(round(self.memoryLimit / 1048576.0)) + "MB"
+    self.useNumpy= False
+    if self.useSciPy or self.useMultigrid:
+      return
+    name= self.selectBackend(nodeCount, ['SciPy', 'Multigrid'])
+    if name is not None:
+      self.activateBackend(name, nodeCount)
+
+  def checkBoundaryMode(self):
+    """
+    checkBoundaryMode(Solver self)
+    Only the SciPy, Stencil and Multigrid solvers eliminate Dirichlet boundary cells,
+    the other solvers keep the Norton boundaries. The Dirichlet SciPy solve is not equilibrated.
+    """
+    if self.boundaryMode != "dirichlet":
+      return
+    for name in ['Spice', 'Aztec', 'Amesos', 'Eigen', 'Numpy', 'Transient', 'Quadtree', 'Nested']:
+      if self.__dict__['use' + name] == True:
+        print "Warning: The " + name + " solver does not support boundaryMode dirichlet, using norton"
+    if self.equilibrate and self.useSciPy == True:
+      print "Warning: equilibrate is not applied with boundaryMode dirichlet"
+
+  def backendTime(self, name, start):
+    if name == self.autoBackend:
+      self.autoSeconds= time.time() - start
+
+  def reportBackend(self, seconds):
+    """
+    reportBackend(Solver self, float seconds)
+    Log the predicted and the actual time and memory of the backend picked by Auto.
+    The time is of the solve with that backend only, and the memory is what the backend holds,
+    from backendBytes. The growth of the peak resident set size since the solver was created is
+    also logged, it is zero when an earlier solve in the process already reached a higher peak.
+    """
+    print "Auto solver backend= " + self.autoBackend + \
+      " predicted time= " + str(round(self.autoEstimate[1], 3)) + "s memory= " + str(round(self.autoEstimate[0] / 1048576.0, 1)) + "MB" + \
+      " actual time= " + str(round(seconds, 3)) + "s memory= " + str(round(self.backendBytes() / 1048576.0, 1)) + "MB" + \
+      " peak RSS growth= " + str(round((peakRSS() - self.startRSS) / 1048576.0, 1)) + "MB"
+
+  def backendBytes(self):
+    """
+    backendBytes(Solver self)
+    Bytes held by the backend picked by Auto after its solve: the dense matrix and the copy
+    that LAPACK factors, the sparse matrix and the L and U factors, or the multigrid levels.
+    A cached SciPy factorization skips the matrix assembly, so then only the factors are counted.
+    """
+    if self.autoBackend == 'Numpy':
+      return 2 * self.As.nbytes
+    if self.autoBackend == 'SciPy':
+      return arrayBytes([self.Asp, self.sciFactor.L, self.sciFactor.U])
+    return arrayBytes([level.__dict__.values() for level in self.multigrid.levels] +
+                      [self.multigrid.colors, self.multigrid.coarseInverse])
+    
   # Boundary conditions are stored in Numpy arrays
   def loadBoundaryCondition(self, lyr, mesh, matls):
-    for nodeThis in range(0, self.NumGlobalElements):
-      x, y= mesh.nodeLocation(nodeThis)
-      if (mesh.ifield[x, y, mesh._isoflag] == 1):
-        # The node at x, y gets on-diagonal conductance incremented by the amount of conductance in the boundary.
-        # The Norton equivalent current source I is V*R which is mesh.field[x, y, mesh._isodeg] * matls.boundCond        
-        self.boundaryCondVec[nodeThis] = mesh.field[x, y, mesh._isodeg]
-        # self.boundaryCondMatl[nodeThis] = matls.boundCond  
-        self.boundaryCondMatl[nodeThis] = mesh.field[x, y, mesh._boundCond]
-        self.BoundaryNodeCount += 1
-      else:
-        self.boundaryCondVec[nodeThis] = -512.0
-        self.boundaryCondMatl[nodeThis] = 0.0
-      self.totalInjectedCurrent += mesh.field[x, y, mesh._heat]    
+    """
+    loadBoundaryCondition(Solver self, Layers lyr, Mesh mesh, Matls matls)
+    Gather the boundary temperature and conductance of each node from the mesh layers.
+    The node at x, y gets on-diagonal conductance incremented by the amount of conductance in the boundary.
+    The Norton equivalent current source I is V*G which is mesh.field[x, y, mesh._isodeg] * mesh.field[x, y, mesh._boundCond]
+    Nodes without a boundary condition are marked with -512.0 in boundaryCondVec.
+    """
+    xn= mesh.nodeXn[:self.NumGlobalElements]
+    yn= mesh.nodeYn[:self.NumGlobalElements]
+    isoflag= mesh.ifield[xn, yn, mesh._isoflag] == 1
+    self.boundaryCondVec[:]= np.where(isoflag, mesh.field[xn, yn, mesh._isodeg], -512.0)
+    self.boundaryCondMatl[:]= np.where(isoflag, mesh.field[xn, yn, mesh._boundCond], 0.0)
+    self.BoundaryNodeCount += int(np.count_nonzero(isoflag))
+    self.totalInjectedCurrent= sequentialSum(self.totalInjectedCurrent, mesh.field[xn, yn, mesh._heat])
+
+  def cachedFactor(self, backend, mesh):
+    """
+    cachedFactor(Solver self, string backend, Mesh mesh)
+    Look up the factorization for the conductance matrix of the mesh.
+    Returns the cache key and the factorization, or None on a cache miss.
+    """
+    key= self.factorCache.meshKey(mesh, self.orderedBackend(backend), self.GDamping)
+    factor= self.factorCache.get(key)
+    self.factorCache.report(backend)
+    return key, factor
+    
+  def setupReorder(self, mesh):
+    if self.reorder != "none":
+      self.sciSolver.reorder= Reorder.Reorder(self.reorder, mesh.nodeXn, mesh.nodeYn)
+    else:
+      self.sciSolver.reorder= None
+    
+  def orderedBackend(self, backend):
+    """
+    orderedBackend(Solver self, string backend)
+    Factorizations with different node orderings are kept apart in the cache,
+    the reordering only applies to the SciPy factorizations.
+    """
+    if self.equilibrate and backend in ["SciPy", "Amesos"]:
+      backend= backend + "/equilibrated"
+    if not backend.startswith("Amesos") and self.reorder != "none":
+      return backend + "/" + self.reorder
+    return backend
+    
+  def setupEquilibration(self, mesh):
+    """
+    setupEquilibration(Solver self, Mesh mesh)
+    With equilibrate, the matrix backends solve (D A D) y = D b and x = D y, where
+    D = diag(A)^-1/2, so the scaled matrix has a unit diagonal and copper rows are not orders
+    of magnitude larger than FR-4 rows. The diagonal comes from the edge conductances,
+    so it is known without assembling A when the factorization is cached.
+    self.scale is the diagonal of D, all ones without equilibrate.
+    """
+    if self.equilibrate:
+      diag= Stencil2D.Stencil2D(mesh, self.GDamping).diag[mesh.nodeXn, mesh.nodeYn]
+      self.scale= 1.0 / np.sqrt(diag)
+    else:
+      self.scale= np.ones(mesh.nodeCount, dtype = 'double')
+
+  def systemMatrix(self, lyr, mesh, matls):
+    """
+    systemMatrix(Solver self, Layers lyr, Mesh mesh, Matls matls)
+    The matrix that the backends solve, D A D with equilibrate, otherwise A.
+    """
+    A= self.sparseMatrix(lyr, mesh, matls)
+    if not self.equilibrate:
+      return A
+    D= sparse.diags(self.scale)
+    return (D * A * D).tocsr()
+
+  def systemRHS(self):
+    return self.scale * self.bsp
+
+  def unscale(self, y):
+    """
+    unscale(Solver self, y)
+    The solution x = D y of a backend solution y.
+    """
+    return self.scale * np.asarray(y, dtype = 'double')[:len(self.scale)]
+
+  def sparseMatrix(self, lyr, mesh, matls):
+    if self.Asp is None:
+      self.Asp, self.bsp= self.assembleSparseMatrix(lyr, mesh, matls)
+    return self.Asp
 
-  # This is the bottleneck
   # RAM requirement is about 1kb/mesh element for solved Trilinos sparse matrix
+  def assembleSparseMatrix(self, lyr, mesh, matls):
+    """
+    assembleSparseMatrix(Solver self, Layers lyr, Mesh mesh, Matls matls)
+    Whole-array equivalent of loadMatrix.
+    The edge conductances for all neighbor pairs are computed at once, emitted as
+    COO triplets, and converted to a single CSR matrix A.
+    Returns A and the RHS b, both indexed by mesh node number.
+    """
+    nodes= mesh.ifield[:, :, mesh._holeflag]
+    gx, gy= mesh.edgeConductances()
+    
+    # Diagonal: sum of the conductances to the neighbors, plus the boundary conductance.
+    diag= np.empty((mesh.width, mesh.height), dtype = 'double')
+    diag.fill(self.GDamping)
+    diag[:-1, :] += gx
+    diag[1:, :]  += gx
+    diag[:, :-1] += gy
+    diag[:, 1:]  += gy
+    
+    # The node at x, y gets on-diagonal conductance incremented by the amount of conductance in the boundary.
+    isoflag= mesh.ifield[:, :, mesh._isoflag] == 1
+    diag += np.where(isoflag, mesh.field[:, :, mesh._boundCond], 0.0)
+    
+    xn= mesh.nodeXn
+    yn= mesh.nodeYn
+    b= self.assembleRHS(mesh)
+    
+    # Off-diagonal triplets, each conductance appears above and below the diagonal.
+    pairs= (nodes[:-1, :] >= 0) & (nodes[1:, :] >= 0)
+    rowsX= nodes[:-1, :][pairs]
+    colsX= nodes[1:, :][pairs]
+    valsX= -gx[pairs]
+    pairs= (nodes[:, :-1] >= 0) & (nodes[:, 1:] >= 0)
+    rowsY= nodes[:, :-1][pairs]
+    colsY= nodes[:, 1:][pairs]
+    valsY= -gy[pairs]
+    diagIdx= np.arange(mesh.nodeCount)
+    
+    rows= np.concatenate((diagIdx, rowsX, colsX, rowsY, colsY))
+    cols= np.concatenate((diagIdx, colsX, rowsX, colsY, rowsY))
+    vals= np.concatenate((diag[xn, yn], valsX, valsX, valsY, valsY))
+    A= sparse.coo_matrix((vals, (rows, cols)), shape=(mesh.nodeCount, mesh.nodeCount)).tocsr()
+    return A, b
+
+  def assembleRHS(self, mesh, heat=None):
+    """
+    assembleRHS(Solver self, Mesh mesh, ndarray heat)
+    Whole-array RHS b, indexed by mesh node number.
+    b gets the heat sources and the Norton current source which is mesh.field[x, y, mesh._isodeg] * boundaryCond
+    The heat sources are mesh.field[:, :, mesh._heat] unless a heat array of the same shape is given.
+    A heat array with an extra last axis of K scenarios gives K columns of b.
+    """
+    xn= mesh.nodeXn
+    yn= mesh.nodeYn
+    if heat is None:
+      heat= mesh.field[:, :, mesh._heat]
+    isoflag= mesh.ifield[xn, yn, mesh._isoflag] == 1
+    boundaryCond= np.where(isoflag, mesh.field[xn, yn, mesh._boundCond], 0.0)
+    nortonCurrent= boundaryCond * mesh.field[xn, yn, mesh._isodeg]
+    heatNodes= heat[xn, yn]
+    if heatNodes.ndim == 2:
+      return nortonCurrent[:, np.newaxis] + heatNodes
+    return nortonCurrent + heatNodes
+
+  # Element-by-element reference loader, assembleSparseMatrix is the whole-array version.
   def loadMatrix(self, lyr, mesh, matls, A, b):
     for nodeThis in range(0, mesh.nodeCount):
       x, y= mesh.nodeLocation(nodeThis)
@@ -299,41 +708,275 @@ class Solver2D:
         thisHeat= -mesh.field[x, y, mesh._heat]
         spice.appendSpiceNetlist(thisHeatSource + " " + thisSpiceNode + " 0 DC " + str(thisHeat) + "\n")    
       
-  def checkEnergyBalance(self, mesh, x, b):
+  def solveScenarios(self, lyr, mesh, matls, heatMaps, blockSize=32):
+    """
+    solveScenarios(Solver self, Layers lyr, Mesh mesh, Matls matls, heatMaps, int blockSize)
+    Solve K power scenarios against one factorization of the conductance matrix.
+    heatMaps is either an array shaped like mesh.field[:, :, mesh._heat] with an extra last axis
+    of length K, or a list of K PNG heat layers that are decoded with the mesh palette.
+    The RHS columns are solved blockSize at a time to bound the temporary memory.
+    The Amesos backend is used if it is the only active direct solver, otherwise SciPy.
+    With equilibrate the cached factorization is of D A D, so the RHS is scaled by D and the solution is D Y.
+    Returns the temperature cube [width, height, K] and a list with the energy balance of each scenario,
+    or None, None if a heat map is not the size of the mesh.
+    """
+    if isinstance(heatMaps, list):
+      heatMaps= [mesh.definePNGHeat(fn) for fn in heatMaps]
+      if any([heat is None for heat in heatMaps]):
+        print "Error: Heat scenarios not solved"
+        return None, None
+      heatMaps= np.dstack(heatMaps)
+    if heatMaps.shape[:2] != (mesh.width, mesh.height):
+      print "Error: Heat scenarios size " + str(heatMaps.shape[:2]) + " does not match mesh " + str((mesh.width, mesh.height))
+      return None, None
+    scenarioCount= heatMaps.shape[2]
+    print "Solving " + str(scenarioCount) + " heat scenarios"
+    
+    self.Asp= None
+    self.setupEquilibration(mesh)
+    D= self.scale[:, np.newaxis]
+    if (self.useAmesos == True and self.useSciPy == False):
+      backend= "Amesos"
+      key, factor= self.cachedFactor(backend, mesh)
+      if factor is None:
+        self.solver.loadMatrixCSR(self.systemMatrix(lyr, mesh, matls), self.scale * self.assembleRHS(mesh))
+        factor= self.solver.factorMatrixAmesos()
+        self.factorCache.put(key, factor)
+    else:
+      backend= "SciPy"
+      if (self.useSciPy == False):
+        self.sciSolver= SciSolver.SciSolver(self.NumGlobalElements, self.debug)
+      self.setupReorder(mesh)
+      key, factor= self.cachedFactor(backend, mesh)
+      if factor is None:
+        self.sciSolver.loadMatrixCSR(self.systemMatrix(lyr, mesh, matls), self.scale * self.assembleRHS(mesh))
+        factor= self.sciSolver.factorMatrix()
+        self.factorCache.put(key, factor)
+      
+    xn= mesh.nodeXn
+    yn= mesh.nodeYn
+    temperature= np.zeros((mesh.width, mesh.height, scenarioCount), dtype = 'double')
+    balance= []
+    for start in range(0, scenarioCount, blockSize):
+      end= min(start + blockSize, scenarioCount)
+      B= self.assembleRHS(mesh, heatMaps[:, :, start:end])
+      if backend == "Amesos":
+        Y= self.solver.solveMultiAmesos(D * B, factor)
+      else:
+        Y= factor.solve(D * B)
+      X= D * np.asarray(Y)[:len(self.scale)]
+      temperature[xn, yn, start:end]= X
+      for col in range(0, end - start):
+        balance.append(self.energyBalanceSummary(mesh, X[:, col], B[:, col]))
+    
+    print "scenario, injected power, boundary power out"
+    for scenario in range(0, scenarioCount):
+      print str(scenario) + ", " + str(balance[scenario]['injectedPower']) + ", " + str(balance[scenario]['boundaryPowerOut'])
+    return temperature, balance
+  
+  def energyBalanceSummary(self, mesh, x, b):
+    """
+    energyBalanceSummary(Solver self, Mesh mesh, ndarray x, ndarray b)
+    Whole-array energy balance of one solution x of Ax = b, returned as a dictionary.
+    The injected power is the heat part of b, the boundary power out is the current
+    in the boundary resistors that is not due to the Norton current sources.
+    """
+    xn= mesh.nodeXn
+    yn= mesh.nodeYn
+    isoflag= mesh.ifield[xn, yn, mesh._isoflag] == 1
+    boundaryCond= np.where(isoflag, mesh.field[xn, yn, mesh._boundCond], 0.0)
+    nortonCurrent= boundaryCond * mesh.field[xn, yn, mesh._isodeg]
+    summary= {}
+    summary['totalMatrixPower']= b.sum()
+    summary['injectedPower']= (b - nortonCurrent).sum()
+    summary['boundaryPowerOut']= (x * boundaryCond - nortonCurrent).sum()
+    return summary
+      
+  def solveEigen(self, lyr, mesh, matls):
+    """
+    solveEigen(Solver self, Layers lyr, Mesh mesh, Matls matls)
+    Conditioning diagnostics of the conductance matrix A without PyTrilinos:
+    the 1-norm condition estimate of A and of the equilibrated D A D, then the extreme
+    eigenvalues of A and the slowest thermal modes with Lanczos.
+    This replaces the Anasazi BlockDavidson eigensolver, which needs PyTrilinos and often failed.
+    """
+    A= self.sparseMatrix(lyr, mesh, matls)
+    factor= self.eigenFactor(mesh, A)
+    self.estimateCondition(A, factor)
+    self.lanczosEigenvalues(mesh, A, factor)
+
+  def eigenFactor(self, mesh, A):
+    """
+    eigenFactor(Solver self, Mesh mesh, ndarray A)
+    SuperLU factorization of A, shared with the SciPy backend through the factorization cache.
+    An equilibrated SciPy solve caches the factorization of D A D, so then A is factored here.
+    """
+    solver= SciSolver.SciSolver(A.shape[0], self.debug)
+    if self.reorder != "none":
+      solver.reorder= Reorder.Reorder(self.reorder, mesh.nodeXn, mesh.nodeYn)
+    if self.equilibrate:
+      return solver.factorMatrix(A)
+    key, factor= self.cachedFactor("SciPy", mesh)
+    if factor is None:
+      factor= solver.factorMatrix(A)
+      self.factorCache.put(key, factor)
+    return factor
+
+  def estimateCondition(self, A, factor):
+    """
+    estimateCondition(Solver self, ndarray A, factor)
+    Estimate the 1-norm condition number of A and of the equilibrated D A D,
+    cond(A) = |A| |A^-1|, with the LAPACK-style block estimator onenormest.
+    |A^-1| is estimated from a few solves with the factorization of A,
+    which also gives (D A D)^-1 = D^-1 A^-1 D^-1, so no second factorization is needed.
+    """
+    d= 1.0 / np.sqrt(A.diagonal())
+    D= sparse.diags(d)
+    inverse= linalg.LinearOperator(A.shape, matvec=factor.solve, rmatvec=factor.solve, dtype = 'double')
+    scaledInverse= linalg.LinearOperator(A.shape, matvec=lambda v: factor.solve(np.ravel(v) / d) / d,
+                                         rmatvec=lambda v: factor.solve(np.ravel(v) / d) / d, dtype = 'double')
+    self.conditionEstimate= linalg.onenormest(A) * linalg.onenormest(inverse)
+    self.scaledConditionEstimate= linalg.onenormest((D * A * D).tocsr()) * linalg.onenormest(scaledInverse)
+    print "Condition number estimate: " + str(self.conditionEstimate)
+    print "Condition number estimate after equilibration: " + str(self.scaledConditionEstimate)
+
+  def lanczosEigenvalues(self, mesh, A, factor):
+    """
+    lanczosEigenvalues(Solver self, Mesh mesh, ndarray A, factor)
+    The largest eigenvalue of A with Lanczos on A, and the smallest with Lanczos on A^-1
+    (shift-invert at zero) using the factorization. The 2-norm condition number is their ratio.
+    Then the slowest thermal modes, the eigenvectors of G v = lambda C v with the smallest
+    decay rates lambda, where C is the heat capacity of the cells. If some cell has no heat capacity
+    the modes are those of A. The modes are loaded into the mesh layers mode1, mode2, ... that exist.
+    Each Lanczos run gets an equal share of what is left of timeBudget seconds, and
+    ncv is the number of Lanczos vectors, fewer vectors are faster for these well separated eigenvalues.
+    """
+    cfg= self.eigenConfig
+    budget= float(cfg.get('timeBudget', 10.0))
+    modes= int(cfg.get('modes', 2))
+    tolerance= float(cfg.get('tolerance', 1.0e-4))
+    deadline= time.time() + budget
+    inverse= linalg.LinearOperator(A.shape, matvec=factor.solve, dtype = 'double')
+    v= np.ones(A.shape[0], dtype = 'double')
+    opStart= time.time()
+    A.dot(v)
+    multiplyTime= time.time() - opStart
+    opStart= time.time()
+    factor.solve(v)
+    solveTime= time.time() - opStart
+
+    largest, vectors= self.budgetedLanczos(A, 1, (deadline - time.time()) / 3.0, multiplyTime,
+                                           which='LA', tol=tolerance)
+    smallest, vectors= self.budgetedLanczos(A, 1, (deadline - time.time()) / 2.0, solveTime,
+                                            sigma=0.0, which='LM', OPinv=inverse, tol=tolerance)
+    if (len(largest) > 0 and len(smallest) > 0):
+      self.largestEigenvalue= largest.max()
+      self.smallestEigenvalue= smallest.min()
+      print "Largest Eigenvalue: " + str(self.largestEigenvalue)
+      print "Smallest Eigenvalue: " + str(self.smallestEigenvalue)
+      print "Condition number: " + str(self.largestEigenvalue / self.smallestEigenvalue)
+
+    cap= mesh.field[mesh.nodeXn, mesh.nodeYn, mesh._cap]
+    options= dict(sigma=0.0, which='LM', OPinv=inverse, tol=tolerance)
+    if (cap > 0.0).all():
+      options['M']= sparse.diags(cap).tocsr()
+    rates, vectors= self.budgetedLanczos(A, modes, deadline - time.time(), solveTime, **options)
+    order= np.argsort(rates)
+    for idx in range(0, len(order)):
+      rate= rates[order[idx]]
+      vector= vectors[:, order[idx]]
+      if 'M' in options:
+        print "Thermal mode " + str(idx + 1) + ": decay rate= " + str(rate) + "/s time constant= " + str(1.0 / rate) + "s"
+      else:
+        print "Thermal mode " + str(idx + 1) + ": eigenvalue= " + str(rate)
+      layerName= '_mode' + str(idx + 1)
+      if layerName in mesh.__dict__:
+        self.loadSolutionIntoMesh(mesh.__dict__[layerName], mesh, vector * np.sign(vector[np.abs(vector).argmax()]))
+
+  def budgetedLanczos(self, A, k, budget, opTime, **options):
+    """
+    budgetedLanczos(Solver self, A, int k, float budget, float opTime, options)
+    ARPACK Lanczos (eigsh) for k eigenpairs of A. ARPACK cannot be stopped from outside,
+    so the number of restarts is limited to what fits in budget seconds, when a restart is
+    about ncv applications of an operator that takes opTime seconds.
+    Returns the eigenvalues and eigenvectors that converged, which can be fewer than k.
+    """
+    ncv= min(A.shape[0] - 1, max(2 * k + 1, int(self.eigenConfig.get('ncv', 10))))
+    maxiter= max(1, int(budget / max(opTime * ncv, 1.0e-6)))
+    try:
+      return linalg.eigsh(A, k, ncv=ncv, maxiter=maxiter, **options)
+    except linalg.ArpackNoConvergence as err:
+      print "Warning: Lanczos found " + str(len(err.eigenvalues)) + " of " + str(k) + \
+        " eigenvalues within the time budget of " + str(round(budget, 3)) + "s"
+      return err.eigenvalues, err.eigenvectors
+
+  def checkEnergyBalance(self, mesh, x, b, boundaryPower=None):
     """
-    checkEnergyBalance(Solver self, Layers lyr, Mesh mesh)
+    checkEnergyBalance(Solver self, Mesh mesh, ndarray x, ndarray b, ndarray boundaryPower)
     Compare the power input of the simulation to the power output.
     The power input is from the current sources and the 
     power output is into the boundary conditions.
+    The totals are accumulated in node order with sequentialSum, so they are the same
+    to the last bit as a loop over the nodes.
+    The power out of each boundary segment, a connected group of boundary pixels,
+    is in self.boundarySegmentPower, indexed by segment label minus one.
+    With Dirichlet boundaries, b is the heat and boundaryPower is the power out of each node,
+    since the boundary nodes are not in the matrix and have no Norton current.
     """
+    x= np.asarray(x, dtype = 'double')[:mesh.nodeCount]
+    b= np.asarray(b, dtype = 'double')[:mesh.nodeCount]
+    vec= self.boundaryCondVec[:mesh.nodeCount]
+    matl= self.boundaryCondMatl[:mesh.nodeCount]
     # boundaryPowerOut is the current in the boundary resistors that are not due to the boundary current source.
-    self.totalMatrixPower = 0.0
-    self.boundaryPowerOut = 0.0    
-
     print "n, x, b, bcCond, totalMatrixPower, boundaryPowerOut"              
-    # nodecount= mesh.solveTemperatureNodeCount()
-    for n in range(0, mesh.nodeCount):
-      self.totalMatrixPower += b[n]
-      if self.boundaryCondVec[n] == -512.0:
-        self.totalBoundaryCurrent += b[n]
-      else:
-        self.boundaryPowerOut += (x[n] - self.boundaryCondVec[n]) * self.boundaryCondMatl[n]
-      # print str(n) + ", " + str(self.x[n]) + ", " + str(self.b[n]) + ", " + str(self.boundaryCondVec[n]) + ", " + str(self.totalMatrixPower) + ", " + str(self.boundaryPowerOut)
+    boundary= vec != -512.0
+    if boundaryPower is None:
+      powerOut= (x[boundary] - vec[boundary]) * matl[boundary]
+    else:
+      powerOut= np.asarray(boundaryPower, dtype = 'double')[:mesh.nodeCount][boundary]
+    self.totalMatrixPower= sequentialSum(0.0, b)
+    self.totalBoundaryCurrent= sequentialSum(self.totalBoundaryCurrent, b[~boundary])
+    self.boundaryPowerOut= sequentialSum(0.0, powerOut)
 
     print "Total Injected Designed Power = " + str(self.totalInjectedCurrent)
     print "Total Injected Matrix Power = " + str(self.totalBoundaryCurrent)
     print "Total Boundary Power Including Norton current sources = ", self.totalMatrixPower
     print "Total Power Calculated from Boundary temperature rise = ", self.boundaryPowerOut
+    self.boundarySegmentPower= self.boundarySegments(mesh, boundary, powerOut)
+
+  def boundarySegments(self, mesh, boundary, powerOut):
+    """
+    boundarySegments(Solver self, Mesh mesh, ndarray boundary, ndarray powerOut)
+    Label the connected groups of boundary pixels and print the power out of each.
+    boundary flags the nodes with a boundary condition and powerOut is their power out.
+    Returns the power per segment.
+    """
+    xn= mesh.nodeXn[:mesh.nodeCount][boundary]
+    yn= mesh.nodeYn[:mesh.nodeCount][boundary]
+    pixels= np.zeros((mesh.width, mesh.height), dtype = 'bool')
+    pixels[xn, yn]= True
+    labels, segmentCount= ndimage.label(pixels)
+    nodeLabels= labels[xn, yn] - 1
+    power= np.bincount(nodeLabels, weights=powerOut, minlength=segmentCount)
+    nodes= np.bincount(nodeLabels, minlength=segmentCount)
+    first= np.zeros(segmentCount, dtype = 'int')
+    first[nodeLabels[::-1]]= np.arange(len(nodeLabels))[::-1]
+    for segment in range(0, segmentCount):
+      print "Boundary segment " + str(segment + 1) + " at " + str(xn[first[segment]]) + ", " + str(yn[first[segment]]) + \
+        " nodes= " + str(nodes[segment]) + " power= " + str(power[segment])
+    return power
 
-  def solveAmesos(self, mesh, lyr):
-    self.solver.solveMatrixAmesos()
-    self.loadSolutionIntoMesh(mesh._deg, mesh, self.solver.x)
-    self.checkEnergyBalance(mesh, self.solver.x, self.solver.b)
+  def solveAmesos(self, mesh, lyr, factor=None):
+    self.solver.solveMatrixAmesos(factor)
+    x= self.unscale(self.solver.x)
+    self.loadSolutionIntoMesh(mesh._deg, mesh, x)
+    self.checkEnergyBalance(mesh, x, self.bsp)
 
   def solveAztecOO(self, mesh, lyr):
     self.solver.solveMatrixAztecOO(400000)
-    self.loadSolutionIntoMesh(mesh._deg, mesh, self.solver.x)
-    self.checkEnergyBalance(mesh, self.solver.x, self.solver.b)   
+    x= self.unscale(self.solver.x)
+    self.loadSolutionIntoMesh(mesh._deg, mesh, x)
+    self.checkEnergyBalance(mesh, x, self.bsp)   
 
   def solveSpice(self, mesh, lyr):
     self.spice.solveSpice()
@@ -341,19 +984,517 @@ class Solver2D:
     # TODO: Need energy balance check here
     
   def solveNumpy(self, mesh, lyr):
-    self.xs = np.linalg.solve(self.As, self.bs)
+    self.xs = self.unscale(np.linalg.solve(self.As, self.bs))
     self.loadSolutionIntoMesh(mesh._npdeg, mesh, self.xs)
-    self.checkEnergyBalance(mesh, self.xs, self.bs)
+    self.checkEnergyBalance(mesh, self.xs, self.bsp)
+      
+  def solveSciPy(self, mesh, lyr, factor=None):
+    self.sciSolver.solveMatrixSuperLU(factor)
+    x= self.unscale(self.sciSolver.x)
+    self.loadSolutionIntoMesh(mesh._spdeg, mesh, x)
+    self.checkEnergyBalance(mesh, x, self.bsp)
+      
+  def solveSciPyDirichlet(self, lyr, mesh, matls):
+    """
+    solveSciPyDirichlet(Solver self, Layers lyr, Mesh mesh, Matls matls)
+    SuperLU solve with the boundary nodes eliminated: they are held at isodeg and
+    A_FF x_F = heat_F - A_FD isodeg_D is solved for the free nodes F only, where A is the
+    conductance matrix without the boundary conductances. The power out of each boundary node
+    is its heat minus its row of A x, which is the current that the boundary must take away.
+    The reduced system has its own SciSolver and reordering, so the full-node reordering of
+    self.sciSolver, which the transient solve shares, is left alone.
+    """
+    nodeCount= mesh.nodeCount
+    fixed= self.boundaryCondVec[:nodeCount] != -512.0
+    free= np.nonzero(~fixed)[0]
+    A= self.sparseMatrix(lyr, mesh, matls) - sparse.diags(self.boundaryCondMatl[:nodeCount])
+    heat= mesh.field[mesh.nodeXn, mesh.nodeYn, mesh._heat]
+    x= np.where(fixed, self.boundaryCondVec[:nodeCount], 0.0)
+    Afree= A[free]
+    bFree= heat[free] - Afree.dot(x)
+    print "Dirichlet boundary nodes= " + str(nodeCount - len(free)) + " unknowns= " + str(len(free))
+    solver= SciSolver.SciSolver(len(free), self.debug)
+    if self.reorder != "none":
+      solver.reorder= Reorder.Reorder(self.reorder, mesh.nodeXn[free], mesh.nodeYn[free])
+    key, factor= self.cachedFactor("SciPyDirichlet", mesh)
+    if factor is None:
+      solver.loadMatrixCSR(Afree[:, free], bFree)
+      factor= solver.factorMatrix()
+      self.factorCache.put(key, factor)
+    else:
+      solver.loadRHS(bFree)
+    self.sciFactor= factor
+    solver.solveMatrixSuperLU(factor)
+    x[free]= solver.x
+    self.loadSolutionIntoMesh(mesh._spdeg, mesh, x)
+    self.checkEnergyBalance(mesh, x, heat, heat - A.dot(x))
+
+  def boundaryStencil(self, stencil, mesh, b):
+    """
+    boundaryStencil(Solver self, Stencil2D stencil, Mesh mesh, ndarray b)
+    The stencil and RHS for the iterative solvers in the boundary mode,
+    with Dirichlet boundaries the reduced stencil of Stencil2D.eliminate.
+    """
+    if self.boundaryMode != "dirichlet":
+      return stencil, b
+    fixed= (mesh.ifield[:, :, mesh._isoflag] == 1) & ~stencil.holes
+    return stencil.eliminate(fixed, mesh.field[:, :, mesh._isodeg], b)
+
+  def stencilEnergyBalance(self, mesh, stencil, x, b):
+    """
+    stencilEnergyBalance(Solver self, Mesh mesh, Stencil2D stencil, ndarray x, ndarray b)
+    checkEnergyBalance for a grid solution x of the full stencil and RHS b.
+    With Dirichlet boundaries the boundary cells of x are set to isodeg, and the power out
+    of each is its heat minus its outflow to its neighbors.
+    """
+    xn= mesh.nodeXn
+    yn= mesh.nodeYn
+    if self.boundaryMode != "dirichlet":
+      self.checkEnergyBalance(mesh, x[xn, yn], b[xn, yn])
+      return
+    fixed= (mesh.ifield[:, :, mesh._isoflag] == 1) & ~stencil.holes
+    x[fixed]= mesh.field[:, :, mesh._isodeg][fixed]
+    heat= mesh.field[:, :, mesh._heat]
+    power= heat - stencil.outflow(x)
+    self.checkEnergyBalance(mesh, x[xn, yn], heat[xn, yn], power[xn, yn])
+
+  def solveStencil(self, mesh, lyr):
+    """
+    solveStencil(Solver self, Mesh mesh, Layers lyr)
+    Matrix-free solve: the 5-point stencil is applied from the edge conductance arrays
+    and the system is solved with Jacobi preconditioned conjugate gradient.
+    No sparse matrix is assembled, so this scales to meshes that are too large for the direct solvers.
+    """
+    cfg= self.stencilConfig
+    self.stencil= Stencil2D.Stencil2D(mesh, self.GDamping)
+    b= self.stencil.rhs(mesh)
+    solveStencil, solveB= self.boundaryStencil(self.stencil, mesh, b)
+    x= solveStencil.solvePCG(solveB, tolerance=float(cfg.get('tolerance', 1e-10)),
+                             maxIterations=int(cfg.get('maxIterations', 10000)))
+    print "Stencil PCG iterations= " + str(solveStencil.iterations) + " relative residual= " + str(solveStencil.residual)
+    self.stencilEnergyBalance(mesh, self.stencil, x, b)
+    solved= ~self.stencil.holes
+    mesh.field.plane(mesh._stdeg)[solved]= x[solved]
+      
+  def solveMultigrid(self, mesh, lyr):
+    """
+    solveMultigrid(Solver self, Mesh mesh, Layers lyr)
+    Geometric multigrid on the matrix-free stencil, without PyTrilinos.
+    mode "pcg" uses one multigrid cycle as the conjugate gradient preconditioner,
+    mode "standalone" iterates multigrid cycles.
+    """
+    cfg= self.multigridConfig
+    fullStencil= Stencil2D.Stencil2D(mesh, self.GDamping)
+    fullB= fullStencil.rhs(mesh)
+    stencil, b= self.boundaryStencil(fullStencil, mesh, fullB)
+    self.multigrid= Multigrid2D.Multigrid2D(stencil, cycle=cfg.get('cycle', 'F'),
+                                            preSmooth=int(cfg.get('preSmooth', 1)),
+                                            postSmooth=int(cfg.get('postSmooth', 1)),
+                                            coarseCells=int(cfg.get('coarseCells', 1024)),
+                                            overCorrection=float(cfg.get('overCorrection', 1.8)))
+    self.multigrid.report()
+    tolerance= float(cfg.get('tolerance', 1e-10))
+    maxIterations= int(cfg.get('maxIterations', 200))
+    mode= cfg.get('mode', 'pcg')
+    if mode == 'standalone':
+      x= self.multigrid.solve(b, tolerance=tolerance, maxIterations=maxIterations)
+    else:
+      x= self.multigrid.solvePCG(b, tolerance=tolerance, maxIterations=maxIterations)
+    print "Multigrid " + mode + " iterations= " + str(self.multigrid.iterations) + " relative residual= " + str(self.multigrid.residual)
+    self.stencilEnergyBalance(mesh, fullStencil, x, fullB)
+    solved= ~fullStencil.holes
+    mesh.field.plane(mesh._mgdeg)[solved]= x[solved]
+      
+  def solveQuadtree(self, mesh, lyr):
+    """
+    solveQuadtree(Solver self, Mesh mesh, Layers lyr)
+    Sparse direct solve on the adaptive quadtree mesh, which merges uniform areas
+    without heat sources or boundary conditions into larger cells.
+    The hanging faces are corrected by resolving with the same factor and the RHS from
+    Quadtree2D.faceCorrection until the largest change is below tolerance, then
+    the cell solution is unloaded onto the pixel grid.
+    """
+    cfg= self.quadtreeConfig
+    self.quadtree= Quadtree2D.Quadtree2D(mesh, maxLevel=int(cfg.get('maxLevel', 5)),
+                                         balance=(int(cfg.get('balance', 1)) == 1),
+                                         gradingRadius=int(cfg.get('gradingRadius', 4)))
+    self.quadtree.report()
+    A, b= self.quadtree.assembleSparseMatrix(self.GDamping)
+    solver= SciSolver.SciSolver(self.quadtree.nodeCount, self.debug)
+    solver.loadMatrixCSR(A, b)
+    solver.solveMatrixSuperLU()
+    x= solver.x
+    corrections= int(cfg.get('corrections', 10))
+    tolerance= float(cfg.get('tolerance', 1e-6))
+    for sweep in range(0, corrections):
+      xNext= solver.factor.solve(b + self.quadtree.faceCorrection(x))
+      change= np.abs(xNext - x).max()
+      x= xNext
+      if change < tolerance:
+        break
+    if corrections > 0:
+      print "Quadtree face corrections= " + str(sweep + 1) + " last change= " + str(change)
+    x= self.quadtree.unload(x)
+    solved= ~self.quadtree.holes
+    mesh.field.plane(mesh._qtdeg)[solved]= x[solved]
+    # Heat sources and boundary conditions are single-pixel cells, so the pixel RHS is exact there.
+    heat= mesh.field[:, :, mesh._heat]
+    bPixel= heat + self.quadtree.boundCond * mesh.field[:, :, mesh._isodeg]
+    self.checkEnergyBalance(mesh, x[mesh.nodeXn, mesh.nodeYn], bPixel[mesh.nodeXn, mesh.nodeYn])
+      
+  def solveNested(self, lyr, mesh, matls):
+    """
+    solveNested(Solver self, Layers lyr, Mesh mesh, Matls matls)
+    Coarse-to-fine solve for interactive edits.
+    The PNG problem is downsampled levels times by 2x2 blocks with Stencil2D.downsample,
+    the coarse problem is solved with SuperLU, and the answer is interpolated back up one level
+    at a time with sweeps of Gauss-Seidel on each level. The coarse answer is loaded into mesh._nsdeg right away, then it is the initial guess
+    of the full resolution iterative solve, which is refine "pcg" (Jacobi PCG on the stencil),
+    "multigrid" (multigrid PCG) or "aztec" (AztecOO on the assembled matrix).
+    With compare, the full resolution solve is repeated from its default initial guess
+    to report the iterations saved.
+    The coarse answer is within a few percent of the temperature rise, but the iterations are set by
+    the tolerance on the residual and the coarse guess saves few of them, most with a loose tolerance.
+    """
+    cfg= self.nestedConfig
+    levels= int(cfg.get('levels', 2))
+    refine= cfg.get('refine', 'pcg')
+    tolerance= float(cfg.get('tolerance', 1e-10))
+    maxIterations= int(cfg.get('maxIterations', 10000))
+    start= time.time()
+    grids= [Stencil2D.Stencil2D(mesh, self.GDamping)]
+    rhs= [grids[0].rhs(mesh)]
+    for level in range(0, levels):
+      grids.append(grids[-1].downsample())
+      rhs.append(grids[-2].restrict(rhs[-1]))
+    coarse= grids[-1]
+    solver= SciSolver.SciSolver(coarse.width * coarse.height, self.debug)
+    solver.loadMatrixCSR(coarse.sparseMatrix(), rhs[-1].ravel())
+    solver.solveMatrixSuperLU()
+    x= solver.x.reshape(coarse.width, coarse.height)
+    sweeps= int(cfg.get('sweeps', 2))
+    for level in range(levels - 1, -1, -1):
+      x= grids[level].relax(grids[level].interpolate(x), rhs[level], sweeps)
+    stencil= grids[0]
+    b= rhs[0]
+    solved= ~stencil.holes
+    mesh.field.plane(mesh._nsdeg)[solved]= x[solved]
+    coarseTime= time.time() - start
+    print "Nested coarse grid= " + str(coarse.width) + "x" + str(coarse.height) + " time= " + str(round(coarseTime, 3)) + "s"
+
+    def refineSolve(x0):
+      if refine == 'aztec':
+        self.solver.solveMatrixAztecOO(400000, None if x0 is None else x0[mesh.nodeXn, mesh.nodeYn])
+        x= np.zeros((stencil.width, stencil.height), dtype = 'double')
+        x[mesh.nodeXn, mesh.nodeYn]= self.solver.x
+        return x, self.solver.iterations
+      if refine == 'multigrid':
+        multigrid= Multigrid2D.Multigrid2D(stencil)
+        x= multigrid.solvePCG(b, x0, tolerance, maxIterations)
+        return x, multigrid.iterations
+      x= stencil.solvePCG(b, x0, tolerance, maxIterations)
+      return x, stencil.iterations
+
+    if refine == 'aztec':
+      self.solver.loadMatrixCSR(self.sparseMatrix(lyr, mesh, matls), self.bsp)
+    x, iterations= refineSolve(x)
+    refineTime= time.time() - start - coarseTime
+    print "Nested " + refine + " iterations= " + str(iterations) + " time= " + str(round(refineTime, 3)) + "s"
+    if int(cfg.get('compare', 0)) == 1:
+      baseStart= time.time()
+      baseX, baseIterations= refineSolve(None)
+      print "Nested " + refine + " iterations from the default guess= " + str(baseIterations) + \
+        " time= " + str(round(time.time() - baseStart, 3)) + "s saved= " + str(baseIterations - iterations) + \
+        " (" + str(round(100.0 * (baseIterations - iterations) / max(baseIterations, 1), 1)) + "%)"
+    mesh.field.plane(mesh._nsdeg)[solved]= x[solved]
+    self.checkEnergyBalance(mesh, x[mesh.nodeXn, mesh.nodeYn], b[mesh.nodeXn, mesh.nodeYn])
+      
+  def solveTransient(self, lyr, mesh, matls):
+    """
+    solveTransient(Solver self, Layers lyr, Mesh mesh, Matls matls)
+    Transient solution of C dx/dt + G x = b, where C is the lumped heat capacity in mesh._cap
+    and G, b are the steady-state conductance matrix and RHS.
+    The theta method is used up to tstop:
+      (C/dt + theta G) x1 = (C/dt - (1 - theta) G) x0 + b
+    method "backwardEuler" is theta= 1, "trapezoidal" is theta= 0.5.
+    The heat sources are scaled by the optional piecewise-constant powerProfile, a list of
+    [time, scale] pairs that repeats every profilePeriod seconds if that is given.
+    With adaptive= 1 the step size is chosen by solveTransientAdaptive, otherwise it is tstep,
+    with a shorter last step only if tstop is not a whole number of steps.
+    The temperatures at the requested timePoints are interpolated between steps and streamed
+    into a memory-mapped .npy file of shape [timePoints, width, height], with the times in a
+    companion _times.npy file. The final temperature is loaded into mesh._trandeg.
+    """
+    cfg= self.transientConfig
+    theta= self.methodTheta(cfg.get('method', 'backwardEuler'))
+    tstop= float(cfg['tstop'])
+    timePoints= sorted([float(t) for t in cfg.get('timePoints', [tstop])])
+    self.powerProfile= sorted([(float(t), float(scale)) for t, scale in cfg.get('powerProfile', [])])
+    self.profilePeriod= float(cfg.get('profilePeriod', 0.0))
+    
+    G= self.sparseMatrix(lyr, mesh, matls)
+    C= mesh.field[mesh.nodeXn, mesh.nodeYn, mesh._cap]
+    self.transientHeat= mesh.field[mesh.nodeXn, mesh.nodeYn, mesh._heat]
+    self.startTransient(mesh, theta)
+    
+    x= np.empty(mesh.nodeCount, dtype = 'double')
+    x.fill(cfg.get('initialTemp', 25.0))
+    output= self.openTransientOutput(mesh, cfg.get('outputFile', 'tran.npy'), timePoints)
+    self.transientPoints= timePoints
+    self.transientPointIdx= 0
+    self.writeTransientPoints(output, mesh, 0.0, 0.0, x, x)
+    
+    if cfg.get('adaptive', 0) == 1:
+      t, x= self.solveTransientAdaptive(mesh, G, C, x, tstop, output)
+    else:
+      tstep= float(cfg['tstep'])
+      timeEps= tstep * 1e-9
+      t= 0.0
+      for k in range(0, int(np.ceil(tstop/tstep - 1e-9))):
+        t= k * tstep
+        dt= tstep
+        if tstop - t < tstep - timeEps:
+          dt= tstop - t
+        b= self.stepRHS(mesh, t, dt)
+        xNew= self.transientStep(mesh, G, C, b, x, dt)
+        self.writeTransientPoints(output, mesh, t, t + dt, x, xNew)
+        self.recordTransientStep(C, b, x, xNew, dt)
+        x= xNew
+        t= t + dt
+    del output
+    
+    self.loadSolutionIntoMesh(mesh._trandeg, mesh, x)
+    self.reportTransient(mesh, t, x)
+    
+  def solveTransientAdaptive(self, mesh, G, C, x, tstop, output):
+    """
+    solveTransientAdaptive(Solver self, Mesh mesh, G, C, x, float tstop, output)
+    Adaptive time-step controller. The step sizes are restricted to a ladder of
+    dtBuckets sizes dtMin * 2**k, so each bucket is factored once and reused.
+    The local truncation error of a step is estimated from the change in slope,
+      LTE = dt**2 * |(x1 - x0)/dt - (x0 - xPrev)/dtPrev| / (dt + dtPrev)
+    A step with max(LTE) above tolerance is rejected and retried in a smaller bucket.
+    A step with max(LTE) below tolerance/4 lets the next step go up one bucket,
+    since the error grows as dt**2. Steps end exactly on the power profile breakpoints,
+    and after a breakpoint the slope history is discarded and the ladder restarts at dtMin.
+    Returns the final time and temperature.
+    """
+    cfg= self.transientConfig
+    tolerance= float(cfg.get('tolerance', 0.1))
+    dtMin= float(cfg.get('dtMin', 1e-3))
+    bucketCount= int(cfg.get('dtBuckets', 16))
+    buckets= [dtMin * 2**k for k in range(0, bucketCount)]
+    self.transientRejections= 0
+    
+    t= 0.0
+    timeEps= dtMin * 1e-6
+    bucket= 0
+    slope= None
+    while t < tstop - timeEps:
+      breakpoint= self.nextProfileBreakpoint(t, tstop)
+      step= bucket
+      while step > 0 and buckets[step] > breakpoint - t + timeEps:
+        step -= 1
+      if breakpoint - t > buckets[step] - timeEps:
+        dt= buckets[step]
+        stepBucket= step
+      else:
+        dt= breakpoint - t
+        stepBucket= None
+      b= self.stepRHS(mesh, t, dt)
+      xNew= self.transientStep(mesh, G, C, b, x, dt, stepBucket)
+      slopeNew= (xNew - x)/dt
+      if slope is not None:
+        lte= np.abs(slopeNew - slope).max() * dt * dt / (dt + dtPrev)
+        if lte > tolerance and step > 0:
+          self.transientRejections += 1
+          bucket= max(step - max(int(np.ceil(0.5*np.log2(lte/tolerance))), 1), 0)
+          continue
+        if lte < 0.25*tolerance:
+          bucket= min(step + 1, bucketCount - 1)
+        else:
+          bucket= step
+      else:
+        bucket= min(step + 1, bucketCount - 1)
+      self.writeTransientPoints(output, mesh, t, t + dt, x, xNew)
+      self.recordTransientStep(C, b, x, xNew, dt)
+      x= xNew
+      t= t + dt
+      slope= slopeNew
+      dtPrev= dt
+      if t >= breakpoint - timeEps:
+        t= breakpoint
+        slope= None
+        bucket= 0
+    print "Adaptive transient steps= " + str(self.transientSteps) + " rejections= " + str(self.transientRejections) + \
+      " refactorizations= " + str(self.transientFactorizations)
+    return t, x
+    
+  def transientRHS(self, mesh, t, before=False):
+    """
+    transientRHS(Solver self, Mesh mesh, float t, bool before)
+    RHS at time t: the Norton boundary currents plus the heat sources scaled by the power profile.
+    With before= True the power profile is taken just before t, so that a step that ends
+    on a breakpoint does not see the power that starts there.
+    """
+    return self.bsp + (self.profileScale(t, before) - 1.0) * self.transientHeat
+    
+  def stepRHS(self, mesh, t, dt):
+    """
+    stepRHS(Solver self, Mesh mesh, float t, float dt)
+    RHS of the theta method for the step from t to t + dt, (1 - theta) b(t) + theta b(t + dt).
+    For trapezoidal this is the average of the RHS at both ends of the step.
+    """
+    theta= self.transientTheta
+    b= theta * self.transientRHS(mesh, t + dt, True)
+    if theta != 1.0:
+      b += (1.0 - theta) * self.transientRHS(mesh, t)
+    return b
+    
+  def profileScale(self, t, before=False):
+    if self.profilePeriod > 0.0:
+      t= t % self.profilePeriod
+      if before and t < 1e-12 * self.profilePeriod:
+        t= self.profilePeriod
+    scale= 1.0
+    for time, value in self.powerProfile:
+      if time < t or (time == t and not before):
+        scale= value
+    return scale
+    
+  def nextProfileBreakpoint(self, t, tstop):
+    """
+    nextProfileBreakpoint(Solver self, float t, float tstop)
+    The first time after t where the power profile changes, or tstop.
+    """
+    breakpoint= tstop
+    timeEps= 1e-9 * max(tstop, 1.0)
+    if self.profilePeriod > 0.0:
+      periodStart= np.floor(t/self.profilePeriod) * self.profilePeriod
+      starts= [periodStart, periodStart + self.profilePeriod]
+    else:
+      starts= [0.0]
+    for start in starts:
+      for time, value in self.powerProfile:
+        if start + time > t + timeEps:
+          breakpoint= min(breakpoint, start + time)
+      if self.profilePeriod > 0.0 and start > t + timeEps:
+        breakpoint= min(breakpoint, start)
+    return breakpoint
+    
+  def writeTransientPoints(self, output, mesh, t, tNew, x, xNew):
+    """
+    writeTransientPoints(Solver self, output, Mesh mesh, float t, float tNew, x, xNew)
+    Write the requested time points in [t, tNew] by interpolating between x and xNew.
+    """
+    while (self.transientPointIdx < len(self.transientPoints) and 
+           self.transientPoints[self.transientPointIdx] <= tNew + 1e-12 * max(abs(tNew), 1.0)):
+      frac= 0.0
+      if tNew > t:
+        frac= min(max((self.transientPoints[self.transientPointIdx] - t)/(tNew - t), 0.0), 1.0)
+      self.writeTransientPoint(output, self.transientPointIdx, mesh, x + frac*(xNew - x))
+      self.transientPointIdx += 1
+    
+  def methodTheta(self, method):
+    if method == "backwardEuler":
+      return 1.0
+    if method == "trapezoidal":
+      return 0.5
+    print "Unrecognized transient method " + str(method) + ", using backwardEuler"
+    return 1.0
+    
+  def startTransient(self, mesh, theta):
+    """
+    startTransient(Solver self, Mesh mesh, float theta)
+    The hash of the mesh is computed once per run. The factorizations for each
+    distinct dt are kept in self.transientFactors for the run and in the factorization cache
+    for later runs. self.transientFactors is a FactorCache of at most maxFactors entries.
+    """
+    self.transientTheta= theta
+    self.transientKey= self.factorCache.meshKey(mesh, self.orderedBackend("Transient"), self.GDamping, [mesh.field[:, :, mesh._cap]])
+    self.transientFactors= FactorCache.FactorCache(int(self.transientConfig.get('maxFactors', 17)))
+    self.transientSteps= 0
+    self.transientFactorizations= 0
+    self.transientStoredPower= 0.0
+    self.transientLastStep= None
+
+  def recordTransientStep(self, C, b, x, xNew, dt):
+    """
+    recordTransientStep(Solver self, C, b, x, xNew, float dt)
+    Count a step and keep its RHS, its theta-weighted temperature and the power into
+    the heat capacity, so that the energy balance is reported over the last step.
+    """
+    theta= self.transientTheta
+    self.transientStoredPower= (C*(xNew - x)).sum()/dt
+    self.transientLastStep= (b, theta*xNew + (1.0 - theta)*x)
+    self.transientSteps += 1
+
+  def transientFactor(self, G, C, dt, bucket=None):
+    """
+    transientFactor(Solver self, G, C, float dt, int bucket)
+    Factorization of (C/dt + theta G), computed once per distinct dt.
+    The adaptive steps are keyed by their dt bucket index, other steps by dt.
+    """
+    runKey= dt
+    if bucket is not None:
+      runKey= ('bucket', bucket)
+    factor= self.transientFactors.get(runKey)
+    if factor is not None:
+      return factor
+    key= ((self.transientKey[0], self.transientTheta, dt), self.transientKey[1])
+    factor= self.factorCache.get(key)
+    if factor is None:
+      M= G * self.transientTheta + sparse.diags(C / dt, 0)
+      factor= self.sciSolver.factorMatrix(M)
+      self.factorCache.put(key, factor)
+      self.transientFactorizations += 1
+    self.transientFactors.put(runKey, factor)
+    return factor
+
+  def transientStep(self, mesh, G, C, b, x, dt, bucket=None):
+    """
+    transientStep(Solver self, Mesh mesh, G, C, b, x, float dt, int bucket)
+    One theta-method step of length dt from temperature x. Returns the new temperature.
+    """
+    factor= self.transientFactor(G, C, dt, bucket)
+    rhs= C/dt * x + b
+    if self.transientTheta != 1.0:
+      rhs -= (1.0 - self.transientTheta) * G.dot(x)
+    return factor.solve(rhs)
+    
+  def openTransientOutput(self, mesh, fn, timePoints):
+    np.save(os.path.splitext(fn)[0] + '_times.npy', np.array(timePoints, dtype = 'double'))
+    print "Transient output: " + str(len(timePoints)) + " time points in " + fn
+    return np.lib.format.open_memmap(fn, mode='w+', dtype = 'double',
+                                     shape=(len(timePoints), mesh.width, mesh.height))
+    
+  def writeTransientPoint(self, output, pointIdx, mesh, x):
+    output[pointIdx][mesh.nodeXn, mesh.nodeYn]= x
+    output.flush()
+    
+  def reportTransient(self, mesh, t, x):
+    """
+    reportTransient(Solver self, Mesh mesh, float t, ndarray x)
+    The injected power, the power into the heat capacity and the boundary power out
+    are all over the last step, so they balance.
+    """
+    if self.transientLastStep is None:
+      summary= self.energyBalanceSummary(mesh, x, self.transientRHS(mesh, t))
+    else:
+      summary= self.energyBalanceSummary(mesh, self.transientLastStep[1], self.transientLastStep[0])
+    print "Transient time= " + str(t) + " steps= " + str(self.transientSteps) + \
+      " factorizations= " + str(self.transientFactorizations)
+    print "Total Injected Designed Power = " + str(summary['injectedPower'])
+    print "Power into heat capacity = " + str(self.transientStoredPower)
+    print "Total Power Calculated from Boundary temperature rise = " + str(summary['boundaryPowerOut'])
       
   def loadSolutionIntoMesh(self, lyrIdx, mesh, xs):
     """
-    loadSolutionIntoMesh(Solver self, Layers lyr, Mesh mesh)
+    loadSolutionIntoMesh(Solver self, int lyrIdx, Mesh mesh, ndarray xs)
     Load the solution back into a layer in the mesh
     """
-    for nodeThis in range(0, mesh.nodeCount):
-      x, y= mesh.nodeLocation(nodeThis)
-      mesh.field[x, y, lyrIdx] = xs[nodeThis]
-      # print "Temp x y t ", x, y, self.x[nodeThis]      
+    plane= mesh.field.plane(lyrIdx)
+    plane[mesh.nodeXn[:mesh.nodeCount], mesh.nodeYn[:mesh.nodeCount]]= np.asarray(xs)[:mesh.nodeCount]
     
   def printNumpy(self):
     print "Debug: A " + str(self.As)
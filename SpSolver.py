@@ -88,6 +88,7 @@ class SpSolver:
   
   def readDCOperatingPoint(self, fraw, mesh, lyrIdx):
     idx= 0
+    plane= mesh.field.plane(lyrIdx)
     # First point is just zeroes as a placeholder for time
     next(fraw)    
     for line in fraw:
@@ -98,7 +99,7 @@ class SpSolver:
         # TODO: Add to mesh layer here for visualization.
         if self.debug == True:
           print str(idx) + ' ' + voltage + ' ' + str(mesh.spiceNodeX[idx]) + ' ' + str(mesh.spiceNodeY[idx])
-        mesh.field[mesh.spiceNodeX[idx], mesh.spiceNodeY[idx], lyrIdx] = voltage
+        plane[mesh.spiceNodeX[idx], mesh.spiceNodeY[idx]] = voltage
         idx += 1
       continue
 
@@ -107,6 +108,7 @@ class SpSolver:
     atSampleTime= False
     inTimePoint = True
     idx= 0
+    plane= mesh.field.plane(mesh._spicedeg)
     for line in fraw:
       if (atSampleTime == True):
         voltage= line.strip()
@@ -116,7 +118,7 @@ class SpSolver:
           # TODO: Add to mesh layer here for visualization.
           if self.debug == True:
             print str(idx) + ' ' + voltage + ' ' + str(mesh.spiceNodeX[idx]) + ' ' + str(mesh.spiceNodeY[idx])
-          mesh.field[mesh.spiceNodeX[idx], mesh.spiceNodeY[idx], mesh._spicedeg] = voltage
+          plane[mesh.spiceNodeX[idx], mesh.spiceNodeY[idx]] = voltage
           idx += 1
         continue
       if (inTimePoint == True):
@@ -0,0 +1,291 @@
+import numpy as np
+import scipy.sparse as sparse
+import scipy.ndimage as ndimage
+
+class Stencil2D:
+  """
+  Stencil2D: Matrix-free conductance operator for the square 2D mesh.
+
+  The conductance matrix of the 2D mesh is a 5-point stencil, so instead of storing
+  a sparse matrix it is applied directly from the edge conductance arrays:
+    gx[w-1, h] between (x, y) and (x+1, y)
+    gy[w, h-1] between (x, y) and (x, y+1)
+    diag[w, h] sum of the edge conductances, the boundary conductance and the damping.
+  All vectors are arrays of shape [width, height] indexed like mesh.field.
+  Holes have zero edge conductance and a unit diagonal with zero RHS,
+  so they are decoupled from the problem and solve to zero.
+
+  The memory use is a few arrays of width x height doubles:
+  four for the operator and four for the conjugate gradient iteration.
+  """
+
+  def __init__(self, mesh=None, damping=0.0):
+    self.iterations= 0
+    self.residual= 0.0
+    if mesh is None:
+      return
+    holes= mesh.ifield[:, :, mesh._holeflag] < 0
+    gx, gy= mesh.edgeConductances()
+    isoflag= mesh.ifield[:, :, mesh._isoflag] == 1
+    self.boundCond= np.where(isoflag & ~holes, mesh.field[:, :, mesh._boundCond], 0.0)
+    self.setConductances(holes, gx, gy, np.where(holes, 0.0, self.boundCond + damping))
+
+  def setConductances(self, holes, gx, gy, shunt):
+    """
+    setConductances(Stencil2D self, ndarray holes, ndarray gx, ndarray gy, ndarray shunt)
+    Define the operator from the hole mask, the edge conductances and the
+    conductance from each cell to ground, which is the boundary conductance plus the damping.
+    """
+    self.holes= holes
+    self.width, self.height= holes.shape
+    self.gx= gx
+    self.gy= gy
+    self.shunt= shunt
+    self.diag= shunt.copy()
+    self.diag[:-1, :] += gx
+    self.diag[1:, :]  += gx
+    self.diag[:, :-1] += gy
+    self.diag[:, 1:]  += gy
+    self.diag[holes]= 1.0
+
+  def coarsen(self):
+    """
+    coarsen(Stencil2D self)
+    Galerkin coarse operator for aggregation of 2x2 blocks of cells.
+    With piecewise-constant prolongation P, the coarse matrix P^T A P is again a 5-point stencil:
+    the coarse edge conductance is the sum of the fine conductances crossing between two blocks,
+    the coarse shunt is the sum of the fine shunts, and the edges inside a block cancel.
+    High-conductance copper therefore stays high-conductance on the coarse grid.
+    A block is a coarse hole when all of its cells are holes.
+    Odd sizes are padded with holes.
+    """
+    width= (self.width + 1) // 2
+    height= (self.height + 1) // 2
+    holes= self.restrict(~self.holes) == 0
+    gx= np.zeros((2*width - 1, 2*height), dtype = 'double')
+    gx[:self.width - 1, :self.height]= self.gx
+    gx= gx[1::2, :].reshape(width - 1, height, 2).sum(2)
+    gy= np.zeros((2*width, 2*height - 1), dtype = 'double')
+    gy[:self.width, :self.height - 1]= self.gy
+    gy= gy[:, 1::2].reshape(width, 2, height - 1).sum(1)
+    coarse= Stencil2D()
+    coarse.setConductances(holes, gx, gy, self.restrict(self.shunt))
+    return coarse
+
+  def downsample(self):
+    """
+    downsample(Stencil2D self)
+    The problem on a grid of 2x2 blocks of cells, like a PNG image at half the resolution.
+    Unlike coarsen, the conductance across a block face is the mean of the two fine conductances
+    that cross it, not their sum: a face of two cells in series with a path twice as long
+    is the same number of squares. The boundary conductances and the shunts are summed, so a
+    uniform sheet downsamples to the same sheet, and the solution approximates the fine solution
+    instead of being a correction to it.
+    """
+    coarse= self.coarsen()
+    coarse.setConductances(coarse.holes, coarse.gx / 2.0, coarse.gy / 2.0, coarse.shunt)
+    coarse.boundCond= self.restrict(self.boundCond)
+    return coarse
+
+  def interpolate(self, coarse):
+    """
+    interpolate(Stencil2D self, ndarray coarse)
+    Bilinear interpolation from the cell centers of the downsampled grid to this grid,
+    zero in the holes. Coarse holes take the value of the nearest coarse cell that is not a hole,
+    so they do not pull down the cells next to them.
+    """
+    coarseHoles= self.restrict(~self.holes) == 0
+    if coarseHoles.any() and not coarseHoles.all():
+      nearest= ndimage.distance_transform_edt(coarseHoles, return_distances=False, return_indices=True)
+      coarse= coarse[nearest[0], nearest[1]]
+    x, y= np.indices((self.width, self.height)).astype('double')
+    fine= ndimage.map_coordinates(coarse, [(x + 0.5) / 2.0 - 0.5, (y + 0.5) / 2.0 - 0.5], order=1, mode='nearest')
+    fine[self.holes]= 0.0
+    return fine
+
+  def eliminate(self, fixed, temperature, b):
+    """
+    eliminate(Stencil2D self, ndarray fixed, ndarray temperature, ndarray b)
+    Dirichlet elimination of the fixed cells, which are held at temperature.
+    Returns the stencil of the free cells, with the fixed cells as holes, and its RHS.
+    The edge from a free cell to a fixed neighbor becomes a shunt of the free cell, and the current
+    that it carries at the fixed temperature moves into the RHS, so there are no large Norton
+    conductances left. The shunts to the fixed cells play the part of boundCond for boundaryGuess.
+    """
+    holes= self.holes | fixed
+    fixedTemp= np.where(fixed, temperature, 0.0)
+    toFixed= np.zeros((self.width, self.height), dtype = 'double')
+    current= np.zeros((self.width, self.height), dtype = 'double')
+    for g, lo, hi in [(self.gx, np.s_[:-1, :], np.s_[1:, :]), (self.gy, np.s_[:, :-1], np.s_[:, 1:])]:
+      toFixed[lo] += g * fixed[hi]
+      toFixed[hi] += g * fixed[lo]
+      current[lo] += g * fixedTemp[hi]
+      current[hi] += g * fixedTemp[lo]
+    gx= np.where(holes[:-1, :] | holes[1:, :], 0.0, self.gx)
+    gy= np.where(holes[:, :-1] | holes[:, 1:], 0.0, self.gy)
+    reduced= Stencil2D()
+    reduced.setConductances(holes, gx, gy, np.where(holes, 0.0, self.shunt - self.boundCond + toFixed))
+    reduced.boundCond= np.where(holes, 0.0, toFixed)
+    return reduced, np.where(holes, 0.0, b - self.boundCond * temperature + current)
+
+  def restrict(self, fine):
+    """
+    restrict(Stencil2D self, ndarray fine)
+    Sum of each 2x2 block of cells, which is P^T for piecewise-constant prolongation.
+    """
+    width= (self.width + 1) // 2
+    height= (self.height + 1) // 2
+    padded= np.zeros((2*width, 2*height), dtype = fine.dtype)
+    padded[:self.width, :self.height]= fine
+    return padded.reshape(width, 2, height, 2).sum(3).sum(1)
+
+  def prolong(self, coarse):
+    """
+    prolong(Stencil2D self, ndarray coarse)
+    Piecewise-constant interpolation of a coarse grid to this grid, zero in the holes.
+    """
+    fine= coarse.repeat(2, 0).repeat(2, 1)[:self.width, :self.height]
+    fine[self.holes]= 0.0
+    return fine
+
+  def rhs(self, mesh, heat=None):
+    """
+    rhs(Stencil2D self, Mesh mesh, ndarray heat)
+    RHS grid with the heat sources and the Norton current sources of the boundary conditions.
+    The heat sources are mesh.field[:, :, mesh._heat] unless a heat array of the same shape is given.
+    """
+    if heat is None:
+      heat= mesh.field[:, :, mesh._heat]
+    b= heat + self.boundCond * mesh.field[:, :, mesh._isodeg]
+    b[self.holes]= 0.0
+    return b
+
+  def apply(self, x, y=None):
+    """
+    apply(Stencil2D self, ndarray x, ndarray y)
+    Returns y = A x, using y as the output array if it is given.
+    """
+    if y is None:
+      y= np.empty_like(x)
+    np.multiply(self.diag, x, out=y)
+    y[:-1, :] -= self.gx * x[1:, :]
+    y[1:, :]  -= self.gx * x[:-1, :]
+    y[:, :-1] -= self.gy * x[:, 1:]
+    y[:, 1:]  -= self.gy * x[:, :-1]
+    return y
+
+  def sparseMatrix(self):
+    """
+    sparseMatrix(Stencil2D self)
+    The operator as a CSR matrix with one row per cell, numbered x-major like ravel(),
+    including the unit rows of the holes.
+    """
+    index= np.arange(self.width * self.height).reshape(self.width, self.height)
+    rows= [index.ravel(), index[:-1, :].ravel(), index[1:, :].ravel(), index[:, :-1].ravel(), index[:, 1:].ravel()]
+    cols= [index.ravel(), index[1:, :].ravel(), index[:-1, :].ravel(), index[:, 1:].ravel(), index[:, :-1].ravel()]
+    vals= [self.diag.ravel(), -self.gx.ravel(), -self.gx.ravel(), -self.gy.ravel(), -self.gy.ravel()]
+    return sparse.coo_matrix((np.concatenate(vals), (np.concatenate(rows), np.concatenate(cols))),
+                             shape=(self.width * self.height, self.width * self.height)).tocsr()
+
+  def relax(self, x, b, sweeps):
+    """
+    relax(Stencil2D self, ndarray x, ndarray b, int sweeps)
+    Red-black Gauss-Seidel sweeps on A x = b, in place.
+    An interpolated guess is smooth, but it does not hold the boundary cells at their Norton
+    temperature or follow the copper, so its residual is large. A few sweeps remove the
+    high-frequency part of the error that causes it. Returns x.
+    """
+    cx, cy= np.indices((self.width, self.height))
+    colors= [((cx + cy) % 2 == color) & ~self.holes for color in (0, 1)]
+    r= np.empty_like(x)
+    for sweep in range(0, sweeps):
+      for color in colors:
+        self.apply(x, r)
+        np.subtract(b, r, out=r)
+        x[color] += r[color] / self.diag[color]
+    return x
+
+  def outflow(self, x):
+    """
+    outflow(Stencil2D self, ndarray x)
+    The heat flow out of each cell into its neighbors, which is A x without the shunts.
+    It is summed from the edge flows instead of subtracting the shunt from A x, which would
+    lose the small flows of the boundary cells next to their large Norton conductance.
+    """
+    y= np.zeros_like(x)
+    flow= self.gx * (x[:-1, :] - x[1:, :])
+    y[:-1, :] += flow
+    y[1:, :]  -= flow
+    flow= self.gy * (x[:, :-1] - x[:, 1:])
+    y[:, :-1] += flow
+    y[:, 1:]  -= flow
+    return y
+
+  def jacobi(self, r):
+    return r / self.diag
+
+  def boundaryGuess(self, b):
+    """
+    boundaryGuess(Stencil2D self, ndarray b)
+    Uniform temperature at the conductance-weighted mean boundary temperature.
+    The rows of the stencil sum to the boundary conductance, so with a uniform boundary
+    temperature this cancels the Norton current sources exactly and the residual is only
+    due to the heat sources.
+    """
+    x= np.zeros((self.width, self.height), dtype = 'double')
+    boundCond= self.boundCond.sum()
+    if boundCond > 0.0:
+      x.fill((b * (self.boundCond > 0.0)).sum() / boundCond)
+      x[self.holes]= 0.0
+    return x
+
+  def solvePCG(self, b, x0=None, tolerance=1e-10, maxIterations=10000, preconditioner=None):
+    """
+    solvePCG(Stencil2D self, ndarray b, ndarray x0, float tolerance, int maxIterations, preconditioner)
+    Preconditioned conjugate gradient solve of A x = b.
+    The conductance matrix is symmetric positive definite when there is at least one
+    boundary condition, so CG converges.
+    The Norton current sources are much larger than the heat sources, so the convergence test
+    is relative to the residual of boundaryGuess instead of the norm of b. The iteration stops
+    when the residual norm is below tolerance times that reference, whatever x0 is.
+    x0 is the initial guess, the default is boundaryGuess.
+    preconditioner is a function of the residual grid, the default is the Jacobi (diagonal) preconditioner.
+    Returns x and sets self.iterations and self.residual, the final relative residual.
+    """
+    if preconditioner is None:
+      preconditioner= self.jacobi
+    guess= self.boundaryGuess(b)
+    r= b - self.apply(guess)
+    refNorm= np.sqrt(np.vdot(r, r))
+    if refNorm == 0.0:
+      refNorm= 1.0
+    if x0 is None:
+      x= guess
+    else:
+      x= x0.copy()
+      x[self.holes]= 0.0
+      r= b - self.apply(x)
+
+    z= preconditioner(r)
+    p= z.copy()
+    Ap= np.empty_like(x)
+    rz= np.vdot(r, z)
+    self.residual= np.sqrt(np.vdot(r, r)) / refNorm
+    self.iterations= 0
+    while self.residual > tolerance and self.iterations < maxIterations:
+      self.apply(p, Ap)
+      alpha= rz / np.vdot(p, Ap)
+      x += alpha * p
+      r -= alpha * Ap
+      self.iterations += 1
+      self.residual= np.sqrt(np.vdot(r, r)) / refNorm
+      if self.residual <= tolerance:
+        break
+      z= preconditioner(r)
+      rzNew= np.vdot(r, z)
+      p *= rzNew / rz
+      p += z
+      rz= rzNew
+    if self.residual > tolerance:
+      print "Warning: PCG did not converge in " + str(self.iterations) + " iterations, relative residual " + str(self.residual)
+    return x
@@ -1,4 +1,5 @@
 from PyTrilinos import Epetra, AztecOO, Anasazi, Amesos, EpetraExt, ML
+import numpy as np
 
 class TriSolver:  
   def __init__(self, nodeCount, mostCommonNonzeroEntriesPerRow, debug):
@@ -29,20 +30,30 @@ class TriSolver:
     self.xFilename         = self.mmPrefix + "x." + self.mmExtension    
     
 
-  def solveMatrixAmesos(self):
+  def loadMatrixCSR(self, A, b):
     """
-    solveMatrixAmesos(Solver self)
-    # self.x are the unknowns to be solved.
-    # self.A is the sparse matrix describing the thermal matrix
-    # self.b has the sources for heat and boundary conditions
+    loadMatrixCSR(Solver self, scipy.sparse.csr_matrix A, ndarray b)
+    Load a matrix that has already been assembled in CSR form, one row per call.
+    """
+    indptr= A.indptr
+    indices= A.indices.astype('intc')
+    for row in range(0, self.NumGlobalElements):
+      start= indptr[row]
+      end= indptr[row+1]
+      self.A.InsertGlobalValues(row, A.data[start:end], indices[start:end])
+    self.loadRHS(b)
+
+  def loadRHS(self, b):
+    self.b[:]= b
+
+  def factorMatrixAmesos(self):
+    """
+    factorMatrixAmesos(Solver self)
+    Factor self.A with KLU. The returned factorization holds the matrix, the solver
+    and the multivectors of the linear problem, so it can be solved again with a new RHS.
     """
-    iAmRoot = self.Comm.MyPID() == 0
-
     xmulti = Epetra.MultiVector(self.Map, 1, True)
     bmulti= Epetra.MultiVector(self.Map, 1, True)
-    rowCount= self.A.NumGlobalRows()
-    for row in range(0, rowCount):
-      bmulti[0,row]= self.b[row]
 
     self.A.FillComplete()
 
@@ -50,6 +61,22 @@ class TriSolver:
     solver= Amesos.Klu(problem)
     solver.SymbolicFactorization()
     solver.NumericFactorization()
+    return (solver, problem, xmulti, bmulti, self.A)
+
+  def solveMatrixAmesos(self, factor=None):
+    """
+    solveMatrixAmesos(Solver self)
+    # self.x are the unknowns to be solved.
+    # self.A is the sparse matrix describing the thermal matrix
+    # self.b has the sources for heat and boundary conditions
+    # factor is a factorization from factorMatrixAmesos, or None to factor self.A here.
+    """
+    iAmRoot = self.Comm.MyPID() == 0
+
+    if factor is None:
+      factor= self.factorMatrixAmesos()
+    solver, problem, xmulti, bmulti, A= factor
+    bmulti[0,:]= self.b
     ierr = solver.Solve()
 
     xarr= Epetra.MultiVector.ExtractCopy(xmulti)
@@ -59,22 +86,48 @@ class TriSolver:
 
     self.x = Epetra.Vector(xarrf)
     bCheck= Epetra.MultiVector(self.Map, 1)
-    self.A.Multiply(False, self.x, bCheck)
+    A.Multiply(False, self.x, bCheck)
     self.Comm.Barrier()
 
-  def solveMatrixAztecOO(self, iterations):
+  def solveMultiAmesos(self, B, factor=None):
+    """
+    solveMultiAmesos(Solver self, ndarray B, factor)
+    Solve AX = B for all K columns of B[NumGlobalElements, K] in a single blocked call.
+    The linear problem of the factorization temporarily gets K-column multivectors.
+    Returns X[NumGlobalElements, K].
+    """
+    if factor is None:
+      factor= self.factorMatrixAmesos()
+    solver, problem, xmulti, bmulti, A= factor
+    columnCount= B.shape[1]
+    xK= Epetra.MultiVector(self.Map, columnCount, True)
+    bK= Epetra.MultiVector(self.Map, np.ascontiguousarray(B.T))
+    problem.SetLHS(xK)
+    problem.SetRHS(bK)
+    ierr = solver.Solve()
+    problem.SetLHS(xmulti)
+    problem.SetRHS(bmulti)
+    if self.Comm.MyPID() == 0:
+      print "Solver return status: " + str(ierr)
+    return Epetra.MultiVector.ExtractCopy(xK).T
+
+  def solveMatrixAztecOO(self, iterations, x0=None):
     """
-    solveMatrixAztecOO(Solver self, int iterations)
+    solveMatrixAztecOO(Solver self, int iterations, ndarray x0)
     Solve Ax=b with an interative solver.
     A is a sparse square matrix, x is a vector of unknowns, b is a vector of knowns
     This does not work very well as the main solver.
     Sometimes it converges very slowly.
     It might be useful for accuracy enhancement by doing one iteration
     after a direct solve, since it can get a better answer than numerical precision * condition number.
+    x0 is the initial guess in node order, the default is zero.
+    The number of iterations taken is left in self.iterations.
     """
     iAmRoot = self.Comm.MyPID() == 0
 
     self.x = Epetra.Vector(self.Map)
+    if x0 is not None:
+      self.x[:] = x0
 
     try:
       self.A.FillComplete()     
@@ -101,6 +154,7 @@ class TriSolver:
     # solver.SetAztecOption(AztecOO.AZ_solver, AztecOO.AZ_cg)
     # This loads self.x with the solution to the problem
     ierr = solver.Iterate(iterations, 1e-13)
+    self.iterations = solver.NumIters()
 
     if iAmRoot:
       print "Solver return status: " + str(ierr)
@@ -73,7 +73,7 @@ class InteractivePlot:
   def plotDoubleLayer(self, output, layerIdx, device):
     print "Plot double layer " + output + " at layer index " + str(layerIdx)
     plt.figure(1)
-    plotfield= self.mesh.field[:, :, layerIdx];
+    plotfield= self.mesh.field.plane(layerIdx)
     plt.subplot(1,1,1)
     plt.axes(aspect=1)
     quad2= plt.pcolormesh(self.mesh.xr, self.mesh.yr, plotfield)
@@ -89,25 +89,11 @@ class InteractivePlot:
   
   def plotMaskedDoubleLayer(self, output, layerMask, maskValue, layerIdx, device):
     print "Plot masked double layer " + output + " at layer index " + str(layerIdx)
-    w, h, l= self.mesh.field.shape
-    plotfield= np.zeros((w, h), dtype='double')
-    xr, yr= np.mgrid[0:w+1, 0:h+1]
-    activeCellCount= 0
-    activeCellTotal= 0.0
-    
-    for x in range(0, w):
-      for y in range(0, h):    
-        if self.mesh.ifield[x, y, layerMask] >= 0:
-          plotfield[x, y]= self.mesh.field[x, y, layerIdx]
-          activeCellTotal += self.mesh.field[x, y, layerIdx]
-          activeCellCount += 1
-          
-    activeCellAverage = activeCellTotal / activeCellCount
-          
-    for x in range(0, w):
-      for y in range(0, h):    
-        if self.mesh.ifield[x, y, layerMask] < 0:
-          plotfield[x, y]= activeCellAverage
+    # Cells outside the mask are plotted at the average of the active cells.
+    active= self.mesh.ifield.plane(layerMask) >= 0
+    plotfield= np.array(self.mesh.field.plane(layerIdx), dtype='double')
+    activeCellAverage = plotfield[active].sum() / np.count_nonzero(active)
+    plotfield[~active]= activeCellAverage
           
     plt.figure(1)
     plt.subplot(1,1,1)
@@ -126,7 +112,7 @@ class InteractivePlot:
   def plotIntLayer(self, output, layerIdx, device):
     print "Plot int layer" + output + " at layer index " + str(layerIdx)
     plt.figure(1)
-    plotfield= self.mesh.ifield[:, :, layerIdx];
+    plotfield= self.mesh.ifield.plane(layerIdx)
     plt.subplot(1,1,1)
     plt.axes(aspect=1)
     quad2= plt.pcolormesh(self.mesh.xr, self.mesh.yr, plotfield)
@@ -141,8 +127,8 @@ class InteractivePlot:
     return
   
   def plotDeltaDoubleLayer(self, output, layerIdx1, layerIdx2, device):
-    z1= self.mesh.field[:, :, layerIdx1];
-    z2= self.mesh.field[:, :, layerIdx2];
+    z1= self.mesh.field.plane(layerIdx1)
+    z2= self.mesh.field.plane(layerIdx2)
     plotfield= z1 - z2
     allclose= np.allclose(z1, z2, rtol=1e-05, atol=1e-08)
     if allclose:
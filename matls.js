@@ -22,7 +22,7 @@
 { "name":"Air", "conductivity":"0", "specific_heat":"0", "type":"gas", "color":"white"},
 { "name":"ThermalPad", "conductivity":"", "type":"deformable_pad", "color":"CornflowerBlue"},
 { "name":"Solder_mask", "conductivity":"0.9W/m-K", "type":"solid", "thickness":"1.0mil", "color":"Green"},
-{ "name":"Core", "conductivityXX":".343W/m-K", "conductivityYY":".343W/m-K", "conductivityZZ":"1.059W/m-K", "density":"1.85gm/cc", "type":"solid", "emissivity":"0.9", "color":"LimeGreen"},
+{ "name":"Core", "conductivityXX":".343W/m-K", "conductivityYY":".343W/m-K", "conductivityZZ":"1.059W/m-K", "density":"1.85gm/cc", "specific_heat":"1.1J/gm-K", "type":"solid", "emissivity":"0.9", "color":"LimeGreen"},
 { "name":"Prepreg", "conductivity":"1.059W/m-K", "type":"deformable", "emissivity":"0.9", "color":"Lime"},
 { "name":"top_component", "type":"component", "max_height":"5mm", "color":"SandyBrown"},
 { "name":"bottom_component", "type":"component", "max_height":"2mm", "color":"SaddleBrown"}
@@ -31,19 +31,61 @@
     }
   ],
   
+    "pixelPitch": 1.0e-4,
+  
+    "islandAction": "drop",
+  
+    "runDirectory": "",
+  
+    # Content-addressed cache of meshed problems, uncomment to reuse meshes across runs.
+    # "meshCache": { "directory": "meshcache", "maxMegabytes": 2000 },
+  
+    "mesh3d": {
+    "processes": 0,
+    "layers": [
+      { "layer":"topside_cu",         "inputFile":"Layout1.png", "background":"Prepreg" },
+      { "layer":"topside_prepreg",    "inputFile":"Layout2.png" },
+      { "layer":"side2_cu",           "inputFile":"Layout2.png", "coarsen":10 },
+      { "layer":"core1",              "inputFile":"Layout3.png", "coarsen":10 },
+      { "layer":"side3_cu",           "homogenize":1, "coarsen":10 },
+      { "layer":"side4_prepreg",      "homogenize":1, "coarsen":10 }
+    ]
+  },
+  
+    "palette": {
+    "default": "fr4",
+    "colors": [
+      { "name":"heat",   "color":[255, 0, 0],     "matl":"Cu",   "layer":"topside_cu", "heat":48.0e-6 },
+      { "name":"copper", "color":[0, 255, 0],     "matl":"Cu",   "layer":"topside_cu" },
+      { "name":"iso",    "color":[0, 0, 255],     "matl":"Cu",   "layer":"topside_cu", "isoflag":1, "isodeg":25.0, "boundMatl":"Cu" },
+      { "name":"fr4",    "color":[255, 255, 0],   "matl":"Core", "layer":"core1" },
+      { "name":"hole",   "color":[255, 255, 255], "hole":1 }
+    ]
+  },
+  
     "simulation_layers": [
     { "index": 0, "type":"double", "name": "iso"          },
     { "index": 1, "type":"double", "name": "heat"         },
     { "index": 2, "type":"double", "name": "resis"        },
-    { "index": 3, "type":"double", "name": "deg"          },
+    { "index": 3, "type":"double", "name": "deg",          "storage":"float32" },
     { "index": 4, "type":"double", "name": "isodeg"       },
-    { "index": 5, "type":"double", "name": "spicedeg"     },
-    { "index": 6, "type":"double", "name": "npdeg"        },
+    { "index": 5, "type":"double", "name": "spicedeg",     "storage":"float32" },
+    { "index": 6, "type":"double", "name": "npdeg",        "storage":"float32" },
     { "index": 7, "type":"double", "name": "boundCond"    },
-    { "index": 0, "type":"int",    "name": "isonode"      },
-    { "index": 1, "type":"int",    "name": "isoflag"      },
-    { "index": 2, "type":"int",    "name": "spicenodenum" },
-    { "index": 3, "type":"int",    "name": "holeflag"     }
+    { "index": 8, "type":"double", "name": "spdeg",        "storage":"float32" },
+    { "index": 9, "type":"double", "name": "cap"          },
+    { "index": 10, "type":"double", "name": "trandeg",     "storage":"float32" },
+    { "index": 11, "type":"double", "name": "stdeg",       "storage":"float32" },
+    { "index": 12, "type":"double", "name": "mgdeg",       "storage":"float32" },
+    { "index": 13, "type":"double", "name": "qtdeg",       "storage":"float32" },
+    { "index": 14, "type":"double", "name": "nsdeg",       "storage":"float32" },
+    { "index": 15, "type":"double", "name": "mode1",       "storage":"float32" },
+    { "index": 16, "type":"double", "name": "mode2",       "storage":"float32" },
+    { "index": 0, "type":"int",    "name": "isonode",      "storage":"int32"   },
+    { "index": 1, "type":"int",    "name": "isoflag",      "storage":"uint8"   },
+    { "index": 2, "type":"int",    "name": "spicenodenum", "storage":"int32"   },
+    { "index": 3, "type":"int",    "name": "holeflag",     "storage":"int32"   },
+    { "index": 4, "type":"int",    "name": "island",       "storage":"int32"   }
   ]
 
 }
\ No newline at end of file
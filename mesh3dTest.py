@@ -0,0 +1,62 @@
+import numpy as np
+import yaml
+import Matls
+import Layers
+import Palette
+import Mesh3D
+
+def expectedHeat(config):
+  """
+  expectedHeat(dict config)
+  Total heat of the mesh3d stackup, with each heat entry counted only in the layer that it names.
+  """
+  palette= Palette.Palette(config['palette'])
+  total= 0.0
+  for layer in config['mesh3d']['layers']:
+    if 'inputFile' not in layer:
+      continue
+    classes= palette.classify(layer['inputFile'])
+    for idx in range(0, len(palette.entries)):
+      entry= palette.entries[idx]
+      if entry.get('layer', layer['layer']) == layer['layer']:
+        total += float(entry.get('heat', 0.0)) * (classes == idx).sum()
+  return total
+
+def injectedPower(mesh):
+  """
+  injectedPower(Mesh3D mesh)
+  The heat part of the assembled RHS, without the Norton current sources of the boundary bricks.
+  """
+  A, b= mesh.assembleSparseMatrix()
+  occupied= mesh.row >= 0
+  cls= mesh.cls[occupied]
+  z= np.nonzero(occupied)[2]
+  norton= np.where(mesh.isoflagTable[cls, z] == 1, mesh.boundCondTable[cls, z] * mesh.isodegTable[cls, z], 0.0)
+  return b.sum() - norton.sum()
+
+def checkInjectedPower(testNumber, mesh, expected):
+  power= injectedPower(mesh)
+  if np.allclose(power, expected, rtol=1e-9):
+    print "OK " + str(testNumber) + " - injected power " + str(power) + " W"
+  else:
+    print "Not OK " + str(testNumber) + " - injected power " + str(power) + " W, expected " + str(expected) + " W"
+
+def checkBoundaryLayers(testNumber, mesh, config):
+  names= [entry['layer'] for entry in config['palette']['colors'] if entry.get('isoflag', 0) == 1]
+  boundary= (mesh.isoflagTable[mesh.cls, mesh.layerIndex()] == 1) & (mesh.row >= 0)
+  found= [mesh.layerNames[z] for z in range(0, mesh.depth) if boundary[:, :, z].any()]
+  if sorted(set(found)) == sorted(set(names)):
+    print "OK " + str(testNumber) + " - boundary condition bricks only in " + str(found)
+  else:
+    print "Not OK " + str(testNumber) + " - boundary condition bricks in " + str(found) + ", expected " + str(names)
+
+if __name__ == "__main__":
+  matls= Matls.Matls('matls.js')
+  lyr= Layers.Layers('layers.js')
+  with open('mesh.js', 'r') as jsonHandle:
+    config= yaml.load(jsonHandle.read())
+  expected= expectedHeat(config)
+
+  mesh= Mesh3D.Mesh3D('mesh.js', lyr, matls)
+  checkInjectedPower(1, mesh, expected)
+  checkBoundaryLayers(2, mesh, config)
@@ -21,6 +21,8 @@
   
   
   "solver": {  
+    "factorCacheSize": 4,
+    "memoryLimitMB": 4096,
     "solverFlags": [
       {
         "flag": "debug",
@@ -34,8 +36,24 @@
         "flag": "matrixMarket",
         "setting": 1
       },
+      {
+        "flag": "reorder",
+        "setting": "none"
+      },
+      {
+        "flag": "boundaryMode",
+        "setting": "norton"
+      },
+      {
+        "flag": "equilibrate",
+        "setting": 0
+      },
     ],
     "solvers": [
+      {
+        "solverName": "Auto",
+        "active": 0
+      },
       {
         "solverName": "Spice",
         "active": 0,
@@ -43,7 +61,10 @@
       },
       {
         "solverName": "Eigen",
-        "active": 0      
+        "active": 0,
+        "timeBudget": 10.0,
+        "modes": 2,
+        "tolerance": 1e-4
       },
       {
         "solverName": "Aztec",
@@ -57,6 +78,61 @@
         "solverName": "Numpy",
         "active": 0    
       },
+      {
+        "solverName": "SciPy",
+        "active": 0
+      },
+      {
+        "solverName": "Stencil",
+        "active": 0,
+        "tolerance": 1e-10,
+        "maxIterations": 10000
+      },
+      {
+        "solverName": "Multigrid",
+        "active": 0,
+        "mode": "pcg",
+        "cycle": "F",
+        "overCorrection": 1.8,
+        "tolerance": 1e-10,
+        "maxIterations": 200
+      },
+      {
+        "solverName": "Quadtree",
+        "active": 0,
+        "maxLevel": 5,
+        "balance": 1,
+        "gradingRadius": 4,
+        "corrections": 10,
+        "tolerance": 1e-6
+      },
+      {
+        "solverName": "Nested",
+        "active": 0,
+        "levels": 2,
+        "sweeps": 2,
+        "refine": "multigrid",
+        "tolerance": 1e-6,
+        "maxIterations": 10000,
+        "compare": 1
+      },
+      {
+        "solverName": "Transient",
+        "active": 0,
+        "method": "backwardEuler",
+        "tstep": 0.01,
+        "tstop": 10.0,
+        "timePoints": [0.1, 1.0, 10.0],
+        "initialTemp": 25.0,
+        "outputFile": "tran.npy",
+        "adaptive": 0,
+        "tolerance": 0.05,
+        "dtMin": 0.001,
+        "dtBuckets": 16,
+        "maxFactors": 17,
+        "powerProfile": [[0.0, 1.0], [2.0, 0.0]],
+        "profilePeriod": 4.0
+      },
     ],
     "solverDebug":
     {